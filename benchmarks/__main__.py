@@ -0,0 +1,219 @@
+"""Benchmark exrsplit with synthetic images.
+
+Usage: python -m benchmarks [options] (run with --help for options)
+
+Images are generated in a temporary directory, so no external images or network access are needed. Each benchmark
+runs in a fresh worker process, so peak memory usage is measured per benchmark. Startup benchmarks run exrsplit
+commands as new processes, as render farms do for each frame, with and without a --server. Results are printed and
+saved as JSON (--output); given the results of a previous run (--baseline), changes in run time are reported.
+"""
+
+from __future__ import print_function
+import argparse
+from benchmarks import synthetic
+import exrsplit
+import exrsplit.__main__ as exrsplit_main
+from exrsplit import exrheader
+from exrsplit import server as exrsplit_server
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+GROUP_CHANNELS_ITERATIONS = 100
+STARTUP_COMMANDS = 10
+SERVER_TIMEOUT = 30
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark exrsplit.')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--layers', type=int, default=16, help='Number of layers besides the default layer')
+    parser.add_argument('--channels', type=int, default=4, help='Number of channels per layer')
+    parser.add_argument('--depth', type=int, default=1, help='Nesting depth of layer names')
+    parser.add_argument('--views', type=int, default=1)
+    parser.add_argument('--compression', choices=synthetic.COMPRESSIONS, default='zip')
+    parser.add_argument('--pixel-type', choices=synthetic.PIXEL_TYPES, default='half')
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='Number of jobs of the parallel split benchmark (default: number of CPUs)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each benchmark')
+    parser.add_argument('--benchmark', action='append', metavar='NAME',
+                        help='Run only the given benchmark (may be given multiple times; merge requires split)')
+    parser.add_argument('--output', help='Save results as JSON to the given file')
+    parser.add_argument('--baseline', help='Compare with results saved by a previous run')
+    return parser.parse_args()
+
+
+def _group_channels(image):
+    header = exrheader.read_header(image)
+    for _ in range(GROUP_CHANNELS_ITERATIONS):
+        exrsplit.group_channels(exrsplit.classify_channels(header, list(header['channels'])))
+
+
+def _list(image):
+    exrsplit_main.main(exrsplit_main._parse_args(['--list', image]))
+
+
+def _split(image, *options):
+    output_dir = os.path.join(os.path.dirname(image), 'split')
+    shutil.rmtree(output_dir, ignore_errors=True)
+    exrsplit_main.main(exrsplit_main._parse_args(['--output-dir', output_dir, image] + list(options)))
+
+
+def _merge(image, *options):
+    directory = os.path.dirname(image)
+    inputs = sorted(glob.glob(os.path.join(directory, 'split', '*.exr')))
+    exrsplit_main.main(exrsplit_main._parse_args(['--merge'] + list(options) + inputs +
+                                                 [os.path.join(directory, 'merged.exr')]))
+
+
+def _run_commands(image, env):
+    """Run --list and split commands as new processes, STARTUP_COMMANDS times each. Returns their run time.
+
+    Each split writes to a new directory, since overwriting files is slower than creating them on some file systems.
+    """
+    directory = tempfile.mkdtemp(prefix='startup-', dir=os.path.dirname(image))
+    commands = [['--list', image]] + [['--quiet', '--output-dir', os.path.join(directory, str(i)), image]
+                                      for i in range(STARTUP_COMMANDS)]
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        for i in range(STARTUP_COMMANDS):
+            for command in (commands[0], commands[i + 1]):
+                subprocess.check_call([sys.executable, '-m', 'exrsplit'] + command, stdout=devnull, env=env)
+        elapsed = time.time() - start
+    shutil.rmtree(directory, ignore_errors=True)
+    return elapsed
+
+
+def _startup(image):
+    env = dict(os.environ)
+    env.pop(exrsplit_server.SOCKET_VARIABLE, None)
+    return _run_commands(image, env)
+
+
+def _startup_server(image):
+    """Run commands as clients of a server. Only the commands are timed, not starting the server."""
+    socket_path = os.path.join(os.path.dirname(image), 'server.sock')
+    with open(os.devnull, 'w') as devnull:
+        server = subprocess.Popen([sys.executable, '-m', 'exrsplit', '--server', socket_path], stdout=devnull)
+    try:
+        deadline = time.time() + SERVER_TIMEOUT
+        while not os.path.exists(socket_path):
+            if time.time() > deadline or server.poll() is not None:
+                raise RuntimeError('Server failed to start')
+            time.sleep(0.01)
+        return _run_commands(image, dict(os.environ, **{exrsplit_server.SOCKET_VARIABLE: socket_path}))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _benchmarks(args):
+    """List the benchmarks as (name, function, arguments) tuples, in the order they must run."""
+    view_options = [x for view in synthetic.view_names(args.views if args.views > 1 else 0)
+                    for x in ('--view', view)]
+    benchmarks = [
+        ('group_channels', _group_channels, ()),
+        ('list', _list, ()),
+        ('startup', _startup, ()),
+        ('startup_server', _startup_server, ()),
+        ('split_stream', _split, ('--stream',)),
+    ]
+    if args.jobs > 1:
+        benchmarks.append(('split_jobs', _split, ('--jobs', str(args.jobs))))
+    # merge uses the output of split, so it runs right after it
+    return benchmarks + [('split', _split, ()), ('merge', _merge, tuple(view_options))]
+
+
+def _run(queue, function, image, arguments):
+    """Run a benchmark in a worker process.
+
+    Puts the run time and peak resident memory before and after running it in queue, or the error message if it
+    fails. Benchmarks with setup that shouldn't be timed return their own run time.
+    """
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        baseline = exrsplit_main._peak_memory()
+        start = time.time()
+        elapsed = function(image, *arguments)
+        elapsed = time.time() - start if elapsed is None else elapsed
+        queue.put((elapsed, baseline, exrsplit_main._peak_memory()))
+    except BaseException:
+        queue.put(traceback.format_exc())
+
+
+def _measure(function, image, arguments, repeat):
+    results = []
+    for _ in range(repeat):
+        # Not a multiprocessing.Pool, since benchmarks may start worker pools themselves
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run, args=(queue, function, image, arguments))
+        process.start()
+        result = queue.get()
+        process.join()
+        if not isinstance(result, tuple):
+            raise RuntimeError('Benchmark failed:\n{}'.format(result))
+        results.append(result)
+    seconds = [x[0] for x in results]
+    return {
+        'seconds': seconds,
+        'min_seconds': min(seconds),
+        'median_seconds': sorted(seconds)[len(seconds) // 2],
+        'baseline_rss_bytes': max(x[1] for x in results),
+        'peak_rss_bytes': max(x[2] for x in results),
+    }
+
+
+def _report(name, result, baseline):
+    line = '{:16} {:9.3f} s  peak memory {:8.1f} MiB (+{:.1f} MiB)'.format(
+        name, result['median_seconds'], result['peak_rss_bytes'] / 2.0 ** 20,
+        (result['peak_rss_bytes'] - result['baseline_rss_bytes']) / 2.0 ** 20)
+    previous = baseline.get('benchmarks', {}).get(name)
+    if previous:
+        line += '  {:.2f}x baseline time'.format(result['median_seconds'] / previous['median_seconds'])
+    print(line)
+
+
+def main(args):
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    config = {x: getattr(args, x) for x in ('width', 'height', 'layers', 'channels', 'depth', 'views',
+                                            'compression', 'pixel_type', 'jobs', 'repeat')}
+    directory = tempfile.mkdtemp(prefix='exrsplit-benchmarks-')
+    try:
+        image = os.path.join(directory, 'image.exr')
+        names = synthetic.generate(image, args.width, args.height, args.layers, args.channels, args.depth,
+                                   args.views, args.compression, args.pixel_type)
+        print('Image with {} channels, {:.1f} MiB'.format(len(names), os.path.getsize(image) / 2.0 ** 20))
+        results = {}
+        for name, function, arguments in _benchmarks(args):
+            if args.benchmark and name not in args.benchmark:
+                continue
+            results[name] = _measure(function, image, arguments, args.repeat)
+            _report(name, results[name], baseline)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'config': config,
+                'benchmarks': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main(_parse_args())
@@ -0,0 +1,74 @@
+"""Generator of synthetic multi-view, multi-layer OpenEXR images for benchmarks."""
+
+from exrsplit import pixels
+import Imath
+import OpenEXR
+import struct
+
+_CHANNELS = ('R', 'G', 'B', 'A', 'Z', 'depth', 'mask', 'u', 'v', 'X', 'Y', 'shadows')
+_COMPRESSIONS = {
+    'none': Imath.Compression.NO_COMPRESSION, 'rle': Imath.Compression.RLE_COMPRESSION,
+    'zips': Imath.Compression.ZIPS_COMPRESSION, 'zip': Imath.Compression.ZIP_COMPRESSION,
+    'piz': Imath.Compression.PIZ_COMPRESSION, 'pxr24': Imath.Compression.PXR24_COMPRESSION,
+    'b44': Imath.Compression.B44_COMPRESSION, 'b44a': Imath.Compression.B44A_COMPRESSION,
+}
+COMPRESSIONS = sorted(_COMPRESSIONS)
+PIXEL_TYPES = ('half', 'float')
+
+
+def channel_names(layers, channels, depth=1, views=1):
+    """Build channel names of an image.
+
+    The image has a default RGBA layer and the given number of layers with channels each. Layer names are nested
+    depth levels deep (eg. layer0.sub1.sub2 for depth 3). With many views, all layers are repeated for each view,
+    prefixed by the view name (except for the first view, which is the default view).
+
+    >>> channel_names(1, 2, depth=2, views=2)
+    ['R', 'G', 'B', 'A', 'layer0.sub1.R', 'layer0.sub1.G', 'view1.R', 'view1.G', 'view1.B', 'view1.A', \
+'view1.layer0.sub1.R', 'view1.layer0.sub1.G']
+    """
+    names = list(_CHANNELS[:4])
+    for layer in range(layers):
+        layer_name = '.'.join(['layer{}'.format(layer)] + ['sub{}'.format(x) for x in range(1, depth)])
+        names.extend('{}.{}'.format(layer_name, _channel(x)) for x in range(channels))
+    return names + ['view{}.{}'.format(view, x) for view in range(1, views) for x in names]
+
+
+def _channel(index):
+    if index < len(_CHANNELS):
+        return _CHANNELS[index]
+    return 'data{}'.format(index)
+
+
+def view_names(views):
+    return ['view{}'.format(x) for x in range(views)]
+
+
+def _pixels(width, height, seed, pixel_type):
+    """Build a smooth gradient with some noise, so compression behaves as in rendered images."""
+    rows = []
+    for y in range(min(height, 64)):
+        values = [((x * (seed + 3) + y * 7) % 509) / 509.0 + ((x * y + seed) % 7) / 997.0 for x in range(width)]
+        rows.append(struct.pack('<{}f'.format(width), *values))
+    data = b''.join(rows[y % len(rows)] for y in range(height))
+    return pixels.convert(data, pixels.FLOAT, pixel_type)
+
+
+def generate(filename, width=1920, height=1080, layers=8, channels=4, depth=1, views=1, compression='zip',
+             pixel_type='half'):
+    """Write a synthetic image. Returns its channel names."""
+    pixel_type = pixel_type == 'half' and pixels.HALF or pixels.FLOAT
+    if pixel_type == pixels.HALF and not pixels.available():
+        raise ImportError('Half float images require NumPy')
+    names = channel_names(layers, channels, depth, views)
+    header = OpenEXR.Header(width, height)
+    header['channels'] = {x: Imath.Channel(Imath.PixelType(pixel_type)) for x in names}
+    header['compression'] = Imath.Compression(_COMPRESSIONS[compression])
+    if views > 1:
+        header['multiView'] = view_names(views)
+    output = OpenEXR.OutputFile(filename, header)
+    try:
+        output.writePixels({x: _pixels(width, height, i, pixel_type) for i, x in enumerate(names)})
+    finally:
+        output.close()
+    return names
@@ -1 +1,10 @@
 from .exrsplit import *
+
+
+def open(filename):
+    """Open an OpenEXR image to access its layers as NumPy arrays (see exrsplit.image).
+
+    The OpenEXR bindings and NumPy are imported on first use, so importing exrsplit is fast.
+    """
+    from .image import open
+    return open(filename)
@@ -1,30 +1,229 @@
 from __future__ import print_function
-import copy
+import collections
 import exrsplit
-import OpenEXR
+from . import chunks, exrheader, incremental, multipart, pipeline, pixels, schedule, sequence, server, stats, \
+    workers
+import Imath
 import os
 import sys
+import time
 
+# The OpenEXR bindings (which import NumPy), multiprocessing and argparse are imported by the functions using them,
+# so commands start faster. This matters when the command is run for every frame (eg. by a render farm), as do
+# clients of --server.
 
-def _parse_args():
+
+_COMPRESSIONS = collections.OrderedDict((
+    ('none', 0), ('rle', 1), ('zips', 2), ('zip', 3), ('piz', 4), ('pxr24', 5), ('b44', 6), ('b44a', 7),
+    ('dwaa', 8), ('dwab', 9),
+))
+_PIXEL_TYPES = collections.OrderedDict((('half', pixels.HALF), ('float', pixels.FLOAT)))
+_SIZE_UNITS = 'KMGT'
+# Attributes that can't be removed by --drop-attribute
+_REQUIRED_ATTRIBUTES = ('channels', 'compression', 'dataWindow', 'displayWindow', 'lineOrder', 'pixelAspectRatio',
+                        'screenWindowCenter', 'screenWindowWidth', 'tiles', 'type', 'name', 'chunkCount', 'version')
+# Buffers of converted and cropped pixel data, reused across blocks, layers and frames
+_BUFFERS = pixels.BufferPool()
+_PARSER = None
+
+
+def _channel_rule(choices):
+    """Build an argparse type for values that may apply only to color or data channels (eg. zip or data=zip)."""
+    def channel_rule(text):
+        kind, _, value = text.rpartition('=')
+        if kind not in ('', 'color', 'data') or value not in choices:
+            import argparse
+            raise argparse.ArgumentTypeError('invalid value {} (choose from {}, optionally prefixed by color= or '
+                                             'data=)'.format(text, ', '.join(choices)))
+        return kind or None, value
+    return channel_rule
+
+
+def _region(text):
+    """Parse a region of interest given as x0,y0,x1,y1 (inclusive pixel coordinates)."""
+    try:
+        x0, y0, x1, y1 = (int(x) for x in text.split(','))
+    except ValueError:
+        x0 = x1 = None
+    if x0 is None or x1 < x0 or y1 < y0:
+        import argparse
+        raise argparse.ArgumentTypeError('invalid region {} (expected x0,y0,x1,y1 with x0 <= x1 and y0 <= y1)'.format(
+            text))
+    return Imath.Box2i(Imath.V2i(x0, y0), Imath.V2i(x1, y1))
+
+
+def _bounded_int(text, minimum, expected):
+    try:
+        value = int(text)
+    except ValueError:
+        value = minimum - 1
+    if value < minimum:
+        import argparse
+        raise argparse.ArgumentTypeError('invalid value {} (expected {})'.format(text, expected))
+    return value
+
+
+def _positive_int(text):
+    """Parse a positive integer."""
+    return _bounded_int(text, 1, 'a positive integer')
+
+
+def _non_negative_int(text):
+    """Parse a non-negative integer."""
+    return _bounded_int(text, 0, 'a non-negative integer')
+
+
+def _build_parser():
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('-m', '--merge', action='store_true', help='Merge multiple OpenEXR images')
     parser.add_argument('-s', '--split-channels', action='store_true', help='Create a file for each channel instead ' +
                         'of per layer. Data channels (eg. depth, shadows or mask) are saved as grayscale ' +
                         'representations of their data.')
+    parser.add_argument('-y', '--luminance', action='store_true', help='Save grayscale representations of data ' +
+                        'channels created by --split-channels as a single luminance (Y) channel instead of ' +
+                        'identical R, G and B channels')
     parser.add_argument('-p', '--prefix', action='store_true', help='Prefix image filename to output filename')
-    parser.add_argument('--layer', action='append', help='Split only selected Layers')
+    parser.add_argument('--layer', action='append',
+                        help='Split or list only the given layer. Can be an exact name or a glob pattern (eg. ' +
+                        "'car.*' for sublayers of car), matching layer names (default_layer for channels without a " +
+                        'layer), view and layer names (eg. left.car) or full channel names. Can be given multiple ' +
+                        'times.')
+    parser.add_argument('--channel-type', action='append', choices=('R', 'G', 'B', 'A', 'DATA'),
+                        help='Split or list only channels of the given type. Can be given multiple times.')
     parser.add_argument('-l', '--list', action='store_true', help='List layers from images')
+    parser.add_argument('-q', '--quiet', action='store_true', help="Don't print progress of each layer, part, " +
+                        'merged input or frame, only summaries and errors')
+    parser.add_argument('--stats', metavar='FILE', help='Save timings of each phase (opening, decoding, copying and ' +
+                        'writing) of each input, block and output, with bytes read and written, channel counts and ' +
+                        'peak memory, as JSON lines to FILE')
+    parser.add_argument('--trace', metavar='FILE', help='Save the timings of --stats to FILE in the Chrome trace ' +
+                        'event format, to be opened in chrome://tracing or Perfetto')
+    parser.add_argument('--stream', action='store_true', help='Read and write images in blocks of scanlines ' +
+                        'instead of whole images, bounding memory usage by the block height')
+    parser.add_argument('--block-lines', type=_positive_int, default=64, metavar='N',
+                        help='Number of scanlines per block in streaming mode and when merging (default: %(default)s)')
+    parser.add_argument('--prefetch', type=_non_negative_int, default=2, metavar='N',
+                        help='Read up to N blocks of scanlines ahead in the background in streaming mode and when ' +
+                        'merging, overlapping reading with compressing and writing. Useful for network storage. 0 ' +
+                        'disables reading ahead (default: %(default)s)')
+    parser.add_argument('--readahead', type=_non_negative_int, default=0, metavar='N',
+                        help='Read up to N whole input files ahead in the background when splitting many images or ' +
+                        'frames one at a time, so they are cached by the operating system when split. Useful for ' +
+                        'network storage, but files are read entirely, even parts left out by --region or --layer ' +
+                        '(default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=_positive_int, default=1, metavar='N',
+                        help='Compress and write up to N output files concurrently (default: %(default)s)')
+    parser.add_argument('--max-memory', type=_memory_size, metavar='SIZE',
+                        help='Limit the estimated memory of decoded pixels (eg. 8G). Frames of --frames are split ' +
+                        'concurrently by up to --jobs workers, largest first, as long as they fit in SIZE. Images ' +
+                        "that don't fit are split with --stream if possible.")
+    parser.add_argument('--pool', choices=('process', 'thread'), default='process',
+                        help='Run --jobs in worker processes or threads. Threads avoid copying pixel data to ' +
+                        'workers, but only run in parallel if the OpenEXR bindings release the GIL ' +
+                        '(default: %(default)s)')
+    parser.add_argument('-o', '--output-dir', default='',
+                        help='Directory to save split images to (default: current directory)')
+    parser.add_argument('--frames', type=sequence.frame_range, metavar='RANGE',
+                        help='Process frame sequences. Images are given as patterns with the frame number as #### or ' +
+                        '%%04d (eg. beauty.####.exr) and RANGE selects frames (eg. 1-100, 1-100x2 or 1,5,10). ' +
+                        'When splitting, each layer is saved to its own directory and --jobs processes frames ' +
+                        'concurrently.')
+    parser.add_argument('--multipart', action='store_true',
+                        help='Save layers as parts of a single multi-part image (<image name>.parts.exr) instead ' +
+                        'of separate images. Requires the OpenEXR 3.3+ Python bindings and NumPy.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Skip writing split images that are unchanged since the previous run, according to ' +
+                        'a manifest of digests of their pixels saved in .exrsplit-cache under the output directory')
+    parser.add_argument('--compression', action='append', type=_channel_rule(_COMPRESSIONS),
+                        metavar='[color=|data=]{' + ','.join(_COMPRESSIONS) + '}',
+                        help='Compression of split images (default: same as input). Prefix with color= or data= ' +
+                        'to set it only for layers with color channels (R, G, B or A) or only data channels.')
+    parser.add_argument('--pixel-type', action='append', type=_channel_rule(_PIXEL_TYPES),
+                        metavar='[color=|data=]{' + ','.join(_PIXEL_TYPES) + '}',
+                        help='Pixel type of floating point channels of split images (default: same as input). ' +
+                        'Prefix with color= or data= to set it only for color or data channels. ' +
+                        'Requires NumPy.')
+    parser.add_argument('--drop-attribute', action='append', type=_dropped_attribute, metavar='NAME',
+                        help='Remove an attribute of input headers (eg. preview, a thumbnail of the image) from ' +
+                        'split and merged images. Can be given multiple times.')
+    parser.add_argument('--region', type=_region, metavar='X0,Y0,X1,Y1',
+                        help='Split only the given region of images (inclusive pixel coordinates, as the data ' +
+                        'window). Only the scanlines or tiles overlapping the region are decoded.')
+    parser.add_argument('--downsample', type=int, metavar='N',
+                        help='Save proxies of split images, N times smaller in both directions. Each pixel is the ' +
+                        'average of a box of NxN pixels (or the first pixel of the box, for UINT channels such as ' +
+                        'object IDs). Requires NumPy.')
+    parser.add_argument('--unpremultiply', action='store_true',
+                        help='Divide color channels (R, G and B) by the alpha channel of their layer, where alpha ' +
+                        "isn't 0. Requires NumPy.")
+    parser.add_argument('--clamp-data', type=_value_range, metavar='MIN,MAX',
+                        help='Clamp values of data channels (eg. depth) to the range MIN to MAX. Requires NumPy.')
+    parser.add_argument('--normalize-data', action='store_true',
+                        help='Map the range of values of each data channel to 0 to 1 (after --clamp-data). ' +
+                        'Requires NumPy.')
     parser.add_argument('--view', action='append',
-                        help='Treat given prefix as a view instead of a layer. ' +
-                        'First view is treated as the default view.')
-    parser.add_argument('image', nargs='+', help='Input images (if merging, the header data is taken' +
+                        help='Split or list only channels of the given view. With --merge, treat given prefix as a ' +
+                        'view instead of a layer. First view is treated as the default view.')
+    parser.add_argument('--server', metavar='SOCKET',
+                        help='Run commands of clients connecting to a UNIX socket at SOCKET, without images. ' +
+                        'Commands started with the {} environment variable set to SOCKET run in the server, which '
+                        'avoids importing the OpenEXR bindings for each command'.format(server.SOCKET_VARIABLE))
+    parser.add_argument('image', nargs='*', help='Input images (if merging, the header data is taken' +
                         'from first argument and last argument is used as output)')
-    return parser.parse_args()
+    return parser
+
+
+def _value_range(text):
+    """Parse a range of values given as min,max."""
+    try:
+        low, high = (float(x) for x in text.split(','))
+    except ValueError:
+        low = high = None
+    if low is None or high < low:
+        import argparse
+        raise argparse.ArgumentTypeError('invalid range {} (expected min,max with min <= max)'.format(text))
+    return low, high
+
+
+def _memory_size(text):
+    """Parse a size in bytes, optionally followed by K, M, G or T (powers of 1024), eg. 512M or 1.5G."""
+    number, scale = text, 1
+    if text and text[-1].upper() in _SIZE_UNITS:
+        number, scale = text[:-1], 1024 ** (_SIZE_UNITS.index(text[-1].upper()) + 1)
+    try:
+        size = int(float(number) * scale)
+    except ValueError:
+        size = 0
+    if size <= 0:
+        import argparse
+        raise argparse.ArgumentTypeError('invalid size {} (expected a positive number of bytes, optionally followed '
+                                         'by K, M, G or T)'.format(text))
+    return size
+
+
+def _dropped_attribute(text):
+    """Parse the name of an attribute to remove from output headers. Attributes required by OpenEXR can't be
+    removed."""
+    if text in _REQUIRED_ATTRIBUTES:
+        import argparse
+        raise argparse.ArgumentTypeError('attribute {} is required by OpenEXR images'.format(text))
+    return text
+
+
+def _parse_args(argv=None):
+    """Parse a command line. The parser is built once, so commands of --server don't rebuild it."""
+    global _PARSER
+    if _PARSER is None:
+        _PARSER = _build_parser()
+    args = _PARSER.parse_args(argv)
+    if not args.image and args.server is None:
+        _PARSER.error('the following arguments are required: image')
+    return args
 
 
 def _open_inputfile(filename):
+    import OpenEXR
     if not OpenEXR.isOpenExrFile(filename):
         print("Failed reading image. File can't be opened or is not an OpenEXR image.")
         raise SystemExit(1)
@@ -34,15 +233,51 @@ def _open_inputfile(filename):
     return exr_file
 
 
-def _create_output_header(header):
+def _read_header(filename):
+    """Read the header of an image without opening it with the OpenEXR library."""
+    try:
+        return exrheader.read_header(filename)
+    except (IOError, OSError, ValueError):
+        print("Failed reading image. File can't be opened or is not an OpenEXR image.")
+        raise SystemExit(1)
+
+
+def _selected_channels(args, header):
+    """Select channels with --layer, --channel-type and --view (unless merging).
+
+    Returns the names of the selected channels, in the order of the header, and their layout (see
+    exrsplit.channel_layout). Channels are selected from the header only, so deselected channels are never decoded.
+    """
+    fullnames = list(header['channels'])
+    layout = exrsplit.channel_layout(header, fullnames)
+    if args.layer is None and args.view is None and args.channel_type is None:
+        return fullnames, layout
+    layout = exrsplit.select_channels(layout, args.layer, args.view, args.channel_type)
+    selected = set(x.fullname for layer in layout for x in layer)
+    return [x for x in fullnames if x in selected], layout
+
+
+def _create_output_header(header, dropped_attributes=()):
     """Create the header of the output file from the input file.
 
-    Keep most metadata, but remove view, multiView and channel information and add comment.
+    Keep most metadata, but remove view, multiView, channel information and dropped attributes (eg. preview) and add
+    comment. Tiled images keep their tile size if they can be written (see _write_image), but only the full resolution
+    level can be read and written by the OpenEXR Python bindings, so mip-mapped and rip-mapped images are saved with a
+    single level.
+
+    Attribute values aren't copied, so the header can be built once per input and shared by its outputs, which add
+    their channels to a shallow copy of it (see _output_header).
     """
-    header = copy.deepcopy(header)
+    removed = set(('channels', 'view', 'multiView')).union(dropped_attributes)
+    header = {x: value for x, value in header.items() if x not in removed}
     header['channels'] = {}
-    header.pop('view', None)
-    header.pop('multiView', None)
+    tiles = header.get('tiles')
+    if tiles is not None and not multipart.available():
+        del header['tiles']
+        header.pop('type', None)
+    elif tiles is not None and tiles.mode.v != Imath.LevelMode.ONE_LEVEL:
+        header['tiles'] = Imath.TileDescription(tiles.xSize, tiles.ySize, Imath.LevelMode(Imath.LevelMode.ONE_LEVEL),
+                                                tiles.roundingMode)
     comment = b'Processed by exrsplit'
     prev_comment = header.setdefault('comments', comment)
     if prev_comment is not None and comment not in prev_comment:
@@ -50,42 +285,211 @@ def _create_output_header(header):
     return header
 
 
-def _exr_to_multilayer(merged_header, merged_data, filename):
-    """Load an EXR file and rename channels to store in a multi-layer file (for merging)."""
-    exr = _open_inputfile(filename)
-    try:
-        header = exr.header()
-        components = os.path.basename(filename).split('.')[:-1]  # Split components and remove extension
-        if components[0] == 'default_layer':
-            components = components[1:]
-        layer = '.'.join(components)
-
-        views = merged_header.get('view') or merged_header.get('multiView')
-        if views:
-            view = exrsplit.get_view(merged_header, layer)
-            if components[0].encode('UTF-8') == view:
-                if view == views[0]:  # first view is put in default view
-                    layer = layer.split('.', 1)
-                    layer = len(layer) > 1 and layer[1] or ''
-            else:
-                print('{} first component is {}, which is not a valid view.'.format(filename, components[0]))
-                print('Putting in default view {}.'.format(views[0]))
-
-        for channel in header['channels']:
-            fullname = layer and '{}.{}'.format(layer, channel) or channel
-            merged_data[fullname] = exr.channel(channel)
-            merged_header['channels'][fullname] = header['channels'][channel]
+def _write_image(filename, header, channel_data):
+    """Write a whole image.
+
+    OpenEXR.OutputFile doesn't write tiled images correctly, so they are written with the File/Part interface of the
+    OpenEXR 3.3+ bindings, which _create_output_header requires to keep images tiled.
+    """
+    if 'tiles' in header:
+        multipart.write_image(filename, header, channel_data)
+        return
+    import OpenEXR
+    output = OpenEXR.OutputFile(filename, header)
+    try:
+        output.writePixels(channel_data)
     finally:
-        exr.close()
+        output.close()
+
+
+def _read_channels(exr, fullnames, scanlines=None):
+    """Decode the given channels in a single pass over the file.
+
+    If scanlines is given, only the inclusive (first, last) range of scanlines is decoded. Returns a dictionary
+    mapping the full channel names to their pixel data.
+    """
+    if scanlines is None:
+        return dict(zip(fullnames, exr.channels(fullnames)))
+    return dict(zip(fullnames, exr.channels(fullnames, scanLine1=scanlines[0], scanLine2=scanlines[1])))
+
+
+def _scanline_blocks(header, block_lines, origin=None):
+    """Yield inclusive (first, last) ranges of at most block_lines scanlines covering the data window.
+
+    Blocks start at multiples of block_lines from scanline origin (default: the top of the data window), so blocks
+    of tiled images can be aligned to rows of tiles.
+    """
+    data_window = header['dataWindow']
+    origin = data_window.min.y if origin is None else origin
+    first = data_window.min.y
+    while first <= data_window.max.y:
+        last = min(origin + ((first - origin) // block_lines + 1) * block_lines - 1, data_window.max.y)
+        yield first, last
+        first = last + 1
+
+
+def _read_blocks(exr, header, fullnames, block_lines, origin=None):
+    """Decode the given channels in blocks of at most block_lines scanlines, from a reader of _reader.
+
+    Yields tuples of (number of scanlines, {full channel name: pixel data}).
+    """
+    for scanlines in _scanline_blocks(header, block_lines, origin):
+        with stats.phase('decode', scanlines=scanlines, channels=len(fullnames)) as event:
+            decoded_bytes = exr.decoded_bytes
+            block = _read_channels(exr, fullnames, scanlines)
+            event['decoded_bytes'] = exr.decoded_bytes - decoded_bytes
+        yield scanlines[1] - scanlines[0] + 1, block
+
+
+def _tile_aligned(block_lines, header):
+    """Round block_lines up to a multiple of the tile height of tiled images, so each row of tiles is decoded once."""
+    tiles = header.get('tiles')
+    if tiles is None:
+        return block_lines
+    return -(-block_lines // tiles.ySize) * tiles.ySize
+
+
+def _merged_layer(merged_header, filename):
+    """Get the layer name under which channels of an input are stored in the merged file."""
+    components = os.path.basename(filename).split('.')[:-1]  # Split components and remove extension
+    if components[0] == 'default_layer':
+        components = components[1:]
+    layer = '.'.join(components)
+
+    views = merged_header.get('view') or merged_header.get('multiView')
+    if views:
+        view = exrsplit.get_view(merged_header, layer)
+        if components[0].encode('UTF-8') == view:
+            if view == views[0]:  # first view is put in default view
+                layer = layer.split('.', 1)
+                layer = len(layer) > 1 and layer[1] or ''
+        else:
+            print('{} first component is {}, which is not a valid view.'.format(filename, components[0]))
+            print('Putting in default view {}.'.format(views[0]))
+    return layer
+
+
+def _data_window(header):
+    data_window = header['dataWindow']
+    return data_window.min.x, data_window.min.y, data_window.max.x, data_window.max.y
+
+
+def _is_multipart(filename):
+    try:
+        return multipart.is_multipart(filename)
+    except (IOError, OSError, ValueError):
+        return False  # Reported when opened
+
+
+def _open_merge_input(filename):
+    """Open an input of a merge. Returns a list of (input, name) tuples.
+
+    Multi-part images have an input for each part, named after the part, so parts are merged as if they were
+    separate images.
+    """
+    if not _is_multipart(filename):
+        return [(_open_inputfile(filename), filename)]
+    if not multipart.available():
+        print('Error: {} is a multi-part image, which requires the OpenEXR 3.3+ Python bindings and NumPy.'.format(
+            filename), file=sys.stderr)
+        raise SystemExit(1)
+    return [(x, '{}.exr'.format(x.name)) for x in multipart.read(filename)]
+
+
+def _exr_to_multilayer(merged_header, exr, filename):
+    """Rename channels of an EXR file to store in a multi-layer file (for merging).
+
+    The renamed channels are added to merged_header after checking that the input matches the data window and
+    pixel types of the merged file. Returns a dictionary mapping merged channel names to channel names in the
+    input.
+    """
+    header = exr.header()
+    if _data_window(header) != _data_window(merged_header):
+        print('Error: data window of {} is {}, expected {}.'.format(
+            filename, _data_window(header), _data_window(merged_header)), file=sys.stderr)
+        raise SystemExit(1)
+    layer = _merged_layer(merged_header, filename)
+    sources = {}
+    for channel in header['channels']:
+        fullname = layer and '{}.{}'.format(layer, channel) or channel
+        previous = merged_header['channels'].get(fullname)
+        if previous is not None and str(previous) != str(header['channels'][channel]):
+            print('Error: channel {} of {} is {}, but was already merged as {}.'.format(
+                channel, filename, header['channels'][channel], previous), file=sys.stderr)
+            raise SystemExit(1)
+        sources[fullname] = channel
+        merged_header['channels'][fullname] = header['channels'][channel]
+    return sources
+
+
+def _merged_blocks(inputs, scanline_blocks):
+    """Read blocks of scanlines from all inputs.
+
+    Yields tuples of (number of scanlines, {merged channel name: pixel data}).
+    """
+    for scanlines in scanline_blocks:
+        channel_data = {}
+        with stats.phase('decode', scanlines=scanlines, inputs=len(inputs)) as event:
+            for exr, sources in inputs:
+                block = _read_channels(exr, list(sources.values()), scanlines)
+                channel_data.update((x, block[sources[x]]) for x in sources)
+            event.update(channels=len(channel_data), decoded_bytes=sum(len(x) for x in channel_data.values()))
+        yield scanlines[1] - scanlines[0] + 1, channel_data
+
+
+def _write_merged(filename, header, inputs, block_lines, prefetch=0):
+    """Copy blocks of scanlines from all inputs into the merged output file.
+
+    Up to prefetch blocks are read ahead in the background. Tiled images can only be written at once, so they are
+    copied in a single block.
+    """
+    if 'tiles' in header:
+        scanlines = header['dataWindow'].min.y, header['dataWindow'].max.y
+        _, channel_data = next(_merged_blocks(inputs, [scanlines]))
+        with stats.phase('write', output=filename, channels=len(channel_data)):
+            _write_image(filename, header, channel_data)
+        return
+    import OpenEXR
+    output = OpenEXR.OutputFile(filename, header)
+    try:
+        blocks = _merged_blocks(inputs, _scanline_blocks(header, block_lines))
+        for lines, channel_data in pipeline.prefetch(blocks, prefetch):
+            with stats.phase('write', output=filename, lines=lines, channels=len(channel_data)):
+                output.writePixels(channel_data, lines)
+    finally:
+        output.close()
 
 
 def merge_exr(args):
-    if len(args.image) < 3:
-        print('Error: --merge requires at least two inputs and one output image.', file=sys.stderr)
+    with stats.phase('merge', file=args.image[-1], inputs=len(args.image) - 1) as summary:
+        _merge_inputs(args)
+        if stats.enabled():
+            summary.update(read_bytes=sum(_file_size(x) for x in args.image[:-1]),
+                           written_bytes=_file_size(args.image[-1]), peak_memory_bytes=_peak_memory())
+
+
+def _check_merge_args(args):
+    if len(args.image) < 3 and not (len(args.image) == 2 and _is_multipart(args.image[0])):
+        print('Error: --merge requires at least two inputs (or a multi-part input) and one output image.',
+              file=sys.stderr)
+        raise SystemExit(1)
+    if args.frames is not None:
+        print('Error: --frames can not be used with --merge.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.region is not None:
+        print('Error: --region can not be used with --merge.', file=sys.stderr)
         raise SystemExit(1)
+    if args.block_lines < 1:
+        print('Error: --block-lines must be positive.', file=sys.stderr)
+        raise SystemExit(1)
+    for filename in args.image[:-1]:
+        _check_not_overwritten(filename, args.image[-1:], '--merge')
+
 
+def _merge_inputs(args):
+    _check_merge_args(args)
     exr = _open_inputfile(args.image[0])
-    output_header = _create_output_header(exr.header())
+    output_header = _create_output_header(exr.header(), args.drop_attribute or ())
     exr.close()
     views = args.view or []
     if len(views) > 1:
@@ -95,91 +499,870 @@ def merge_exr(args):
         print('Using view {}'.format(views[0]))
         output_header['view'] = views[0].encode('UTF-8')
 
-    channel_data = {}
-    for i, filename in enumerate(args.image[:-1]):
-        print('{}/{} - Merging {}'.format(i + 1, len(args.image) - 1, filename))
-        _exr_to_multilayer(output_header, channel_data, filename)
+    opened = []
+    inputs = []
+    try:
+        # Open and validate all inputs before writing anything
+        for i, filename in enumerate(args.image[:-1]):
+            if not args.quiet:
+                print('{}/{} - Merging {}'.format(i + 1, len(args.image) - 1, filename))
+            with stats.phase('open', file=filename):
+                merge_inputs = _open_merge_input(filename)
+            opened.extend(x for x, _ in merge_inputs)
+            inputs.extend((exr, _exr_to_multilayer(output_header, exr, name)) for exr, name in merge_inputs)
+
+        if 'multiView' in output_header:
+            # The OpenEXR Python bindings returns bytes when multiView information from a header
+            #  is read and expects strings when writing
+            output_header['multiView'] = [x.decode('UTF-8') for x in output_header['multiView']]
+        _write_merged(args.image[-1], output_header, inputs, args.block_lines, args.prefetch)
+    finally:
+        for exr in opened:
+            exr.close()
 
-    if 'multiView' in output_header:
-        # The OpenEXR Python bindings returns bytes when multiView information from a header
-        #  is read and expects strings when writing
-        output_header['multiView'] = [x.decode('UTF-8') for x in output_header['multiView']]
-    output = OpenEXR.OutputFile(args.image[-1], output_header)
+
+def _peak_memory():
+    """Return the peak resident set size of the process in bytes or None if it can't be measured."""
     try:
-        output.writePixels(channel_data)
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+def _makedirs(path):
+    if not path:
+        return
+    try:
+        os.makedirs(path)
+    except OSError:  # Exists (or was created concurrently by another worker)
+        if not os.path.isdir(path):
+            raise
+
+
+def _target_file(args, inputfile, name, frame):
+    """Build the path of the output file for a layer named name.
+
+    Frames of sequences are saved as <output dir>/<name>/<name>.<frame>.exr, other images as <output dir>/<name>.exr.
+    """
+    if frame is None:
+        directory = args.output_dir
+        prefix = os.path.basename(os.path.splitext(inputfile)[0])
+        target_file = '{}.exr'.format(name)
+    else:
+        directory = os.path.join(args.output_dir, name)
+        prefix = frame.name
+        target_file = '{}.{}.exr'.format(name, frame.frame)
+    if args.prefix:
+        target_file = '{}_{}'.format(prefix, target_file)
+    return os.path.join(directory, target_file)
+
+
+def _multipart_target_file(args, inputfile, frame):
+    """Build the path of the multi-part output file.
+
+    Frames of sequences are saved as <output dir>/<sequence name>.parts.<frame>.exr, other images as
+    <output dir>/<image name>.parts.exr.
+    """
+    if frame is None:
+        target_file = '{}.parts.exr'.format(os.path.basename(os.path.splitext(inputfile)[0]))
+    else:
+        target_file = '{}.parts.{}.exr'.format(frame.name, frame.frame)
+    return os.path.join(args.output_dir, target_file)
+
+
+def _output_name(args, layer):
+    if args.split_channels:
+        return '{}.{}'.format(layer[0].output_name, layer[0].channel)
+    return layer[0].output_name
+
+
+def _rule(rules, kind):
+    """Get the value of a _channel_rule option for channels of kind 'color' or 'data', or None if not set.
+
+    Values given for a kind take precedence over values for all channels.
+    """
+    values = dict(rules or ())
+    return values.get(kind, values.get(None))
+
+
+def _output_channel(args, header, channel):
+    """Get the description (pixel type and sampling) of an output channel."""
+    input_channel = header['channels'][channel.fullname]
+    pixel_type = _rule(args.pixel_type, channel.channel_type == 'DATA' and 'data' or 'color')
+    if pixel_type is None or input_channel.type.v == pixels.UINT:
+        return input_channel
+    return Imath.Channel(Imath.PixelType(_PIXEL_TYPES[pixel_type]), input_channel.xSampling, input_channel.ySampling)
+
+
+def _output_header(args, base_header, header, layer):
+    """Build the header of the output of a layer and map its channels to input channels.
+
+    base_header is the header shared by all outputs of the input (see _create_output_header).
+    """
+    out_header = dict(base_header, channels={})
+    compression = _rule(args.compression, all(x.channel_type == 'DATA' for x in layer) and 'data' or 'color')
+    if compression is not None:
+        out_header['compression'] = Imath.Compression(_COMPRESSIONS[compression])
+    sources = {}
+    for channel in layer:
+        if channel.channel_type == 'DATA' and args.split_channels:
+            # Grayscale image of the data. All gray channels share the decoded input channel.
+            gray_channels = args.luminance and ('Y',) or ('R', 'G', 'B')
+            out_header['channels'] = {x: _output_channel(args, header, channel) for x in gray_channels}
+            sources = {x: channel.fullname for x in gray_channels}
+        else:
+            out_header['channels'][channel.channel] = _output_channel(args, header, channel)
+            sources[channel.channel] = channel.fullname
+    return out_header, sources
+
+
+def _plan_outputs(args, inputfile, header, grouped_channels, frame=None):
+    """Build the name, header and channel mapping of every output file.
+
+    Returns a list of (target file, header, {output channel name: input channel name}) tuples.
+    """
+    base_header = _create_output_header(header, args.drop_attribute or ())
+    if args.stream:
+        # Tiled images can't be written in blocks of scanlines
+        base_header.pop('tiles', None)
+        base_header.pop('type', None)
+    outputs = []
+    for layer in grouped_channels:
+        target_file = _target_file(args, inputfile, _output_name(args, layer), frame)
+        outputs.append((target_file,) + _output_header(args, base_header, header, layer))
+    return outputs
+
+
+def _pixel_conversions(args, header, grouped_channels):
+    """Map names of input channels that change pixel type to their (input, output) pixel types."""
+    conversions = {}
+    for channel in (x for layer in grouped_channels for x in layer):
+        input_type = header['channels'][channel.fullname].type.v
+        output_type = _output_channel(args, header, channel).type.v
+        if input_type != output_type:
+            conversions[channel.fullname] = input_type, output_type
+    return conversions
+
+
+def _transformed(args):
+    """Check whether decoded channels are transformed by --downsample, --unpremultiply, --clamp-data or
+    --normalize-data."""
+    return bool((args.downsample or 1) > 1 or args.unpremultiply or args.clamp_data or args.normalize_data)
+
+
+def _downsampled_window(window, factor):
+    """Scale a window (eg. the data window) down by factor, as pixels are by pixels.downsample."""
+    x, y = window.min.x // factor, window.min.y // factor
+    width = -(-(window.max.x - window.min.x + 1) // factor)
+    height = -(-(window.max.y - window.min.y + 1) // factor)
+    return Imath.Box2i(Imath.V2i(x, y), Imath.V2i(x + width - 1, y + height - 1))
+
+
+def _downsampled_header(header, factor):
+    """Copy header with its data and display windows scaled down by factor."""
+    header = dict(header)
+    for window in ('dataWindow', 'displayWindow'):
+        if window in header:
+            header[window] = _downsampled_window(header[window], factor)
+    return header
+
+
+class _CountedInput(object):
+    """Wrap an input file, counting the bytes of the channels it decodes (as decoded_bytes)."""
+
+    def __init__(self, exr):
+        self._exr = exr
+        self.decoded_bytes = 0
+
+    def channels(self, names, **kwargs):
+        decoded = self._exr.channels(names, **kwargs)
+        self.decoded_bytes += sum(len(x) for x in decoded)
+        return decoded
+
+
+class _WrappedInput(object):
+    """Base of wrappers of a _CountedInput. decoded_bytes counts bytes before they are cropped, transformed or
+    converted."""
+
+    def __init__(self, exr):
+        self._exr = exr
+
+    @property
+    def decoded_bytes(self):
+        return self._exr.decoded_bytes
+
+
+class _TransformedInput(_WrappedInput):
+    """Wrap an input file, transforming decoded channels with --downsample, --unpremultiply, --clamp-data and
+    --normalize-data.
+
+    Channels are downsampled first, so colors are averaged while premultiplied. Transforms apply to the layers of
+    the image (lists of EXRChannels), keyed by channel type: color channels are divided by the alpha channel of
+    their layer and data channels (except UINT channels) are clamped and normalized. Transformed channels are
+    copied into buffers of _BUFFERS. Subsampled channels aren't supported.
+    """
+
+    def __init__(self, exr, args, header, layers):
+        super(_TransformedInput, self).__init__(exr)
+        self._factor = args.downsample or 1
+        self._clamp = args.clamp_data
+        self._normalize = args.normalize_data
+        _check_unsampled(header, layers, '--downsample, --unpremultiply, --clamp-data and --normalize-data')
+        data_window = header['dataWindow']
+        self._width = data_window.max.x - data_window.min.x + 1
+        self._pixel_types = {x: channel.type.v for x, channel in header['channels'].items()}
+        self._alphas = {}
+        self._data = set()
+        for layer in layers:
+            alpha = [x.fullname for x in layer if x.channel_type == 'A']
+            for channel in layer:
+                if args.unpremultiply and alpha and channel.channel_type in ('R', 'G', 'B'):
+                    self._alphas[channel.fullname] = alpha[0]
+                elif (args.clamp_data or args.normalize_data) and channel.channel_type == 'DATA' and \
+                        self._pixel_types[channel.fullname] != pixels.UINT:
+                    self._data.add(channel.fullname)
+
+    def channels(self, names, **kwargs):
+        decoded = self._exr.channels(names, **kwargs)
+        arrays = {x: pixels.downsample(pixels.array(data, self._pixel_types[x], self._width), self._factor)
+                  for x, data in zip(names, decoded)}
+        transformed = []
+        for name, data in zip(names, decoded):
+            if self._factor == 1 and name not in self._alphas and name not in self._data:
+                transformed.append(data)
+                continue
+            result = self._transform(name, arrays)
+            transformed.append(pixels.store(result, _BUFFERS.acquire(result.nbytes)))
+        _BUFFERS.release(x for x, y in zip(decoded, transformed) if x is not y)  # Cropped data
+        return transformed
+
+    def _transform(self, name, arrays):
+        result = arrays[name]
+        if self._alphas.get(name) in arrays:
+            result = pixels.unpremultiply(result, arrays[self._alphas[name]])
+        if name in self._data and self._clamp:
+            result = pixels.clamp(result, *self._clamp)
+        if name in self._data and self._normalize:
+            result = pixels.normalize(result)
+        return result
+
+
+class _ConvertedInput(_WrappedInput):
+    """Wrap an input file, converting the pixel type of decoded channels into buffers of _BUFFERS."""
+
+    def __init__(self, exr, conversions):
+        super(_ConvertedInput, self).__init__(exr)
+        self._conversions = conversions
+
+    def channels(self, names, **kwargs):
+        return [x if name not in self._conversions else self._convert(x, *self._conversions[name])
+                for name, x in zip(names, self._exr.channels(names, **kwargs))]
+
+    def _convert(self, data, from_type, to_type):
+        size = len(data) // exrheader.PIXEL_TYPE_SIZE[from_type] * exrheader.PIXEL_TYPE_SIZE[to_type]
+        converted = pixels.convert(data, from_type, to_type, _BUFFERS.acquire(size))
+        _BUFFERS.release([data])  # Cropped data
+        return converted
+
+
+def _crop_region(header, region, inputfile):
+    """Intersect a region of interest with the data window of an image.
+
+    Returns a copy of header with the intersection as data window.
+    """
+    data_window = header['dataWindow']
+    crop = Imath.Box2i(Imath.V2i(max(region.min.x, data_window.min.x), max(region.min.y, data_window.min.y)),
+                       Imath.V2i(min(region.max.x, data_window.max.x), min(region.max.y, data_window.max.y)))
+    if crop.min.x > crop.max.x or crop.min.y > crop.max.y:
+        print('Error: region {} is outside of the data window {} of {}.'.format(region, data_window, inputfile),
+              file=sys.stderr)
+        raise SystemExit(1)
+    header = dict(header)
+    header['dataWindow'] = crop
+    return header
+
+
+def _check_unsampled(header, layers, options):
+    """Fail if channels of layers are subsampled (eg. the RY and BY channels of luminance/chroma images), since
+    options don't support them."""
+    channels = [header['channels'][x.fullname] for layer in layers for x in layer]
+    if any(x.xSampling != 1 or x.ySampling != 1 for x in channels):
+        print('Error: {} does not support subsampled channels.'.format(options), file=sys.stderr)
+        raise SystemExit(1)
+
+
+class _CroppedInput(_WrappedInput):
+    """Wrap an input file, decoding only scanlines and columns within a region of interest.
+
+    Cropped columns are copied into buffers of _BUFFERS. Subsampled channels aren't supported.
+    """
+
+    def __init__(self, exr, header, region):
+        super(_CroppedInput, self).__init__(exr)
+        self._region = region
+        data_window = header['dataWindow']
+        self._width = data_window.max.x - data_window.min.x + 1
+        self._columns = region.min.x - data_window.min.x, region.max.x - data_window.min.x + 1
+        self._pixel_sizes = {x: exrheader.PIXEL_TYPE_SIZE[channel.type.v] for x, channel in header['channels'].items()}
+
+    def channels(self, names, scanLine1=None, scanLine2=None):
+        if scanLine1 is None:
+            scanLine1, scanLine2 = self._region.min.y, self._region.max.y
+        return [self._crop(name, x)
+                for name, x in zip(names, self._exr.channels(names, scanLine1=scanLine1, scanLine2=scanLine2))]
+
+    def _crop(self, name, data):
+        pixel_size = self._pixel_sizes[name]
+        row_size = self._width * pixel_size
+        start, end = self._columns[0] * pixel_size, self._columns[1] * pixel_size
+        if start == 0 and end == row_size:
+            return data
+        rows = range(0, len(data), row_size)
+        cropped = _BUFFERS.acquire(len(rows) * (end - start))
+        view = memoryview(cropped)
+        for i, row in enumerate(rows):
+            view[i * (end - start):(i + 1) * (end - start)] = data[row + start:row + end]
+        return cropped
+
+
+def _print_saving(output_i, outputs):
+    target_file, out_header, _ = outputs[output_i]
+    print('{}/{} - Saving {} channels to {}'.format(output_i + 1, len(outputs),
+                                                    len(out_header['channels']), target_file))
+
+
+def _imap(jobs, pool, function, iterable, lost=None):
+    """Apply function to every item of iterable, yielding results in order.
+
+    Items are processed by a pool of jobs worker processes (or threads, if pool is 'thread'). If the worker process
+    of an item dies (eg. killed for running out of memory), lost(item) is yielded instead, or the command fails if
+    lost is None.
+    """
+    if jobs <= 1:
+        for x in iterable:
+            yield function(x)
+        return
+    pool = workers.Pool(jobs, pool)
+    try:
+        items = list(iterable)
+        job_ids = [pool.submit(_recorded_job, (function, stats.enabled(), x)) for x in items]
+        outcomes = {}
+        for job_id, x in zip(job_ids, items):
+            while job_id not in outcomes:
+                completed_id, outcome = pool.wait()
+                outcomes[completed_id] = outcome
+            recorded, error = outcomes.pop(job_id)
+            if isinstance(error, workers.WorkerLost):
+                if lost is None:
+                    print('Error: a worker process died ({}).'.format(error), file=sys.stderr)
+                    raise SystemExit(1)
+                yield lost(x)
+                continue
+            if error is not None:
+                raise error
+            result, events = recorded
+            stats.extend(events)
+            yield result
+        pool.close()
     finally:
-        output.close()
+        pool.terminate()
+        pool.join()
 
 
-def split_exr(args):
-    for inputfile in args.image:
-        exr = _open_inputfile(inputfile)
-        try:
-            header = exr.header()
-            if args.layer is not None:
-                channels = [exrsplit.EXRChannel(header, layer) for layer in header['channels']
-                            if layer.startswith(tuple(args.layer))]
-            else:
-                channels = [exrsplit.EXRChannel(header, layer) for layer in header['channels']]
-            if args.split_channels:
-                grouped_channels = [[x] for x in channels]
-            else:
-                grouped_channels = exrsplit.group_channels(channels)
-            for layer_i, layer in enumerate(grouped_channels):
-                if args.split_channels:
-                    target_file = '{}.{}.exr'.format(exrsplit.output_file_name(layer[0]), layer[0].channel)
-                else:
-                    target_file = '{}.exr'.format(exrsplit.output_file_name(layer[0]))
-                if args.prefix:
-                    target_file = '{}_{}'.format(os.path.basename(os.path.splitext(inputfile)[0]), target_file)
-                print('{}/{} - Saving {} channels to {}'.format(layer_i + 1, len(grouped_channels),
-                                                                len(layer), target_file))
-                out_header = _create_output_header(header)
-                channel_data = {}
-                for channel in layer:
-                    if channel.channel_type == 'DATA' and args.split_channels:
-                        # Copy pixel format
-                        out_header['channels'] = {x: header['channels'][channel.fullname] for x in ('R', 'G', 'B')}
-                        channel_data = {x: exr.channel(channel.fullname) for x in ('R', 'G', 'B')}
-                    else:
-                        out_header['channels'][channel.channel] = header['channels'][channel.fullname]
-                        channel_data[channel.channel] = exr.channel(channel.fullname)
-                output = OpenEXR.OutputFile(target_file, out_header)
-                output.writePixels(channel_data)
+def _recorded_job(job):
+    """Run a job of a worker pool. Returns its result and the events it recorded, for the main process."""
+    function, record, x = job
+    stats.enable(record)
+    since = stats.mark()
+    return function(x), stats.take(since)
+
+
+def _write_output(job):
+    """Write the pixels of an output file. Runs in the worker pool.
+
+    Pixels are compressed as they are written, so the write phase includes compressing them.
+    """
+    target_file, out_header, channel_data = job
+    with stats.phase('write', output=target_file, channels=len(channel_data)) as event:
+        _makedirs(os.path.dirname(target_file))
+        _write_image(target_file, out_header, channel_data)
+        if stats.enabled():
+            event.update(decoded_bytes=sum(len(x) for x in channel_data.values()),
+                         written_bytes=_file_size(target_file))
+
+
+def _read_decoded(exr, fullnames):
+    """Decode the given channels of the whole input (a reader of _reader), as _read_channels, recording the decode
+    phase."""
+    with stats.phase('decode', channels=len(fullnames)) as event:
+        decoded_bytes = exr.decoded_bytes
+        decoded = _read_channels(exr, fullnames)
+        event['decoded_bytes'] = exr.decoded_bytes - decoded_bytes
+    return decoded
+
+
+def _pending_outputs(outputs, decoded, verbose, manifest=None):
+    """List the outputs to be written, skipping outputs unchanged according to manifest (if given).
+
+    Returns a list of (output index, digest or None, job of _write_output) tuples.
+    """
+    pending = []
+    for output_i, (target_file, out_header, sources) in enumerate(outputs):
+        channel_data = {x: decoded[sources[x]] for x in sources}
+        digest = None
+        if manifest is not None:
+            with stats.phase('digest', output=target_file):
+                digest = incremental.digest(out_header, channel_data)
+        if digest is not None and manifest.is_current(target_file, digest):
+            if verbose:
+                print('{}/{} - Unchanged {}'.format(output_i + 1, len(outputs), target_file))
+            continue
+        pending.append((output_i, digest, (target_file, out_header, channel_data)))
+    return pending
+
+
+def _write_outputs(args, exr, outputs, fullnames, verbose, manifest=None):
+    """Decode the whole input once and write the outputs. Returns the number of decoded bytes.
+
+    If a manifest is given, outputs unchanged since they were recorded in it are skipped.
+    """
+    decoded = _read_decoded(exr, fullnames)
+    pending = _pending_outputs(outputs, decoded, verbose, manifest)
+    # Frames of sequences are already split concurrently
+    if args.frames is not None or args.jobs <= 1:
+        for output_i, digest, job in pending:
+            if verbose:
+                _print_saving(output_i, outputs)
+            _write_output(job)
+            if digest is not None:
+                manifest.record(job[0], digest)
+    else:
+        # Report progress in order as outputs are completed, so it doesn't depend on scheduling
+        jobs = (job for _, _, job in pending)
+        for (output_i, digest, job), _ in zip(pending, _imap(args.jobs, args.pool, _write_output, jobs)):
+            if verbose:
+                _print_saving(output_i, outputs)
+            if digest is not None:
+                manifest.record(job[0], digest)
+    _BUFFERS.release(decoded.values())
+    return exr.decoded_bytes
+
+
+def _stream_outputs(exr, header, outputs, fullnames, block_lines, verbose, origin=None, prefetch=0, downsample=1):
+    """Copy blocks of scanlines from the input to all outputs at once. Returns the number of decoded bytes.
+
+    Blocks are aligned to scanline origin as in _scanline_blocks. Up to prefetch blocks are read ahead in the
+    background. If blocks are downsampled by the input (see _TransformedInput), outputs have downsample times fewer
+    scanlines.
+    """
+    import OpenEXR
+    for output_i in range(len(outputs) if verbose else 0):
+        _print_saving(output_i, outputs)
+    files = []
+    try:
+        for target_file, out_header, _ in outputs:
+            _makedirs(os.path.dirname(target_file))
+            files.append(OpenEXR.OutputFile(target_file, out_header))
+        blocks = _read_blocks(exr, header, fullnames, block_lines, origin)
+        for lines, block in pipeline.prefetch(blocks, prefetch):
+            with stats.phase('write', outputs=len(files), lines=lines):
+                for output, (_, _, sources) in zip(files, outputs):
+                    output.writePixels({x: block[sources[x]] for x in sources}, -(-lines // downsample))
+            _BUFFERS.release(block.values())
+    finally:
+        with stats.phase('close', outputs=len(files)) as event:
+            for output in files:
                 output.close()
-        finally:
-            exr.close()
+            if stats.enabled():
+                event['written_bytes'] = sum(_file_size(x[0]) for x in outputs)
+    return exr.decoded_bytes
 
 
-def list_exr(args):
-    for inputfile in args.image:
+def _write_multipart(args, exr, target_file, grouped_channels, outputs, fullnames, verbose):
+    """Decode the whole input once and write the outputs as parts of a single image.
+
+    Parts are named after the output files they replace. Returns the number of decoded bytes.
+    """
+    decoded = _read_decoded(exr, fullnames)
+    parts = [(_output_name(args, layer), layer[0].view, out_header, {x: decoded[sources[x]] for x in sources})
+             for layer, (_, out_header, sources) in zip(grouped_channels, outputs)]
+    if verbose:
+        print('Saving {} parts to {}'.format(len(parts), target_file))
+    _makedirs(os.path.dirname(target_file))
+    with stats.phase('write', output=target_file, parts=len(parts), channels=len(fullnames)) as event:
+        multipart.write(target_file, parts, args.jobs)
+        if stats.enabled():
+            event['written_bytes'] = _file_size(target_file)
+    _BUFFERS.release(decoded.values())
+    return exr.decoded_bytes
+
+
+def _copyable(image, header, out_header, sources):
+    """Check whether an output can be written by copying compressed pixels of the input."""
+    if out_header['compression'].v != header['compression'].v:
+        return False
+    if any(out_header['channels'][x].type.v != header['channels'][sources[x]].type.v for x in sources):
+        return False
+    return chunks.can_copy(image, sources)
+
+
+def _same_file(filename, other):
+    """Check whether two paths refer to the same existing file."""
+    try:
+        return os.path.samefile(filename, other)
+    except OSError:
+        return False
+
+
+def _check_not_overwritten(inputfile, target_files, mode):
+    """Exit if an output would be written over an input that is read while outputs are written."""
+    if any(_same_file(x, inputfile) for x in target_files):
+        print('Error: {} can not write over its input {}.'.format(mode, inputfile), file=sys.stderr)
+        raise SystemExit(1)
+
+
+def _copy_outputs(args, inputfile, header, outputs, verbose):
+    """Write the outputs that can be copied from compressed pixels of the input, without decoding them.
+
+    Outputs overwriting the input aren't copied, since the input is read while outputs are written. Returns the
+    outputs left to be written.
+    """
+    if args.region is not None or args.multipart or args.incremental or _transformed(args):
+        return outputs
+    try:
+        image = chunks.ScanlineImage(inputfile)
+    except (IOError, OSError, ValueError):
+        return outputs
+    copied = []
+    remaining = []
+    try:
+        for target_file, out_header, sources in outputs:
+            if _same_file(target_file, inputfile) or not _copyable(image, header, out_header, sources):
+                remaining.append((target_file, out_header, sources))
+                continue
+            if verbose:
+                print('Copying {} channels to {}'.format(len(sources), target_file))
+            _makedirs(os.path.dirname(target_file))
+            copied.append((target_file, sources, out_header['comments']))
+        if copied:
+            with stats.phase('copy', outputs=len(copied), channels=sum(len(x[1]) for x in copied)) as event:
+                chunks.write(image, copied, args.drop_attribute or ())
+                if stats.enabled():
+                    event['written_bytes'] = sum(_file_size(x[0]) for x in copied)
+    finally:
+        image.close()
+    return remaining
+
+
+def _split_file(args, inputfile, frame=None):
+    """Split an image. Returns the number of decoded bytes.
+
+    Frames of sequences are split quietly and without a worker pool, since frames are processed concurrently.
+    """
+    with stats.phase('split', file=inputfile) as summary:
+        decoded_size = _split_outputs(args, inputfile, frame, summary)
+        if stats.enabled():
+            summary.update(read_bytes=_file_size(inputfile), decoded_bytes=decoded_size,
+                           peak_memory_bytes=_peak_memory())
+    return decoded_size
+
+
+def _reader(args, exr, input_header, header, layers):
+    """Wrap an input file to crop, transform and convert decoded channels, as requested by args.
+
+    header is the header of the input, cropped by --region. The reader counts decoded bytes (see _CountedInput).
+    """
+    reader = _CountedInput(exr)
+    if args.region is not None:
+        _check_unsampled(input_header, layers, '--region')
+        reader = _CroppedInput(reader, input_header, header['dataWindow'])
+    if _transformed(args):
+        reader = _TransformedInput(reader, args, header, layers)
+    if args.pixel_type:
+        reader = _ConvertedInput(reader, _pixel_conversions(args, header, layers))
+    return reader
+
+
+def _stream_split(args, reader, input_header, header, outputs, fullnames, verbose):
+    """Write the outputs of an image in blocks of scanlines, as _stream_outputs.
+
+    Blocks are aligned to rows of tiles of tiled images. When downsampling, blocks are instead aligned to boxes of
+    downsampled pixels, starting at the top of the (cropped) data window.
+    """
+    block_lines = _tile_aligned(args.block_lines, input_header)
+    factor = args.downsample or 1
+    if factor == 1:
+        return _stream_outputs(reader, header, outputs, fullnames, block_lines, verbose,
+                               input_header['dataWindow'].min.y, args.prefetch)
+    block_lines = -(-block_lines // factor) * factor
+    return _stream_outputs(reader, header, outputs, fullnames, block_lines, verbose, header['dataWindow'].min.y,
+                           args.prefetch, factor)
+
+
+def _split_outputs(args, inputfile, frame, summary):
+    """Split an image as _split_file, adding the number of outputs and channels to its summary event."""
+    verbose = frame is None and not args.quiet
+    with stats.phase('open', file=inputfile):
         exr = _open_inputfile(inputfile)
-        try:
-            header = exr.header()
-            if args.layer is not None:
-                channels = [exrsplit.EXRChannel(header, layer) for layer in header['channels']
-                            if layer.startswith(tuple(args.layer))]
-            else:
-                channels = [exrsplit.EXRChannel(header, layer) for layer in header['channels']]
-            grouped_channels = exrsplit.group_channels(channels)
-            for layer_i, layer in enumerate(grouped_channels):
-                layer_channels = ",".join(sorted([str(x.channel) for x in layer]))
-                print('{}/{} - Layer: {}, Channels: ({})'.format(layer_i + 1,
-                                                                 len(grouped_channels),
-                                                                 layer[0].layer,
-                                                                 layer_channels))
-        finally:
-            exr.close()
+    try:
+        input_header = header = exr.header()
+        if args.region is not None:
+            header = _crop_region(input_header, args.region, inputfile)
+        fullnames, layers = _selected_channels(args, header)
+        grouped_channels = layers
+        if args.split_channels:
+            grouped_channels = [[x] for layer in layers for x in layer]
+        output_header = _downsampled_header(header, args.downsample) if args.downsample else header
+        outputs = _plan_outputs(args, inputfile, output_header, grouped_channels, frame)
+        if args.stream:
+            _check_not_overwritten(inputfile, [x[0] for x in outputs], '--stream')
+        summary.update(outputs=len(outputs), channels=sum(len(x[2]) for x in outputs))
+        outputs = _copy_outputs(args, inputfile, header, outputs, verbose)
+        if not outputs:
+            return 0
+        used_channels = set(x for _, _, sources in outputs for x in sources.values())
+        fullnames = [x for x in fullnames if x in used_channels]
+        reader = _reader(args, exr, input_header, header, layers)
+        if args.multipart:
+            target_file = _multipart_target_file(args, inputfile, frame)
+            return _write_multipart(args, reader, target_file, grouped_channels, outputs, fullnames, verbose)
+        if args.stream:
+            return _stream_split(args, reader, input_header, header, outputs, fullnames, verbose)
+        if not args.incremental:
+            return _write_outputs(args, reader, outputs, fullnames, verbose)
+        manifest = incremental.Manifest(args.output_dir, inputfile)
+        decoded_size = _write_outputs(args, reader, outputs, fullnames, verbose, manifest)
+        manifest.save()
+        return decoded_size
+    finally:
+        exr.close()
+
+
+def _input_frames(args):
+    """List the frames of all input sequences."""
+    try:
+        return [frame for pattern in args.image for frame in sequence.expand(pattern, args.frames)]
+    except ValueError as e:
+        print('Error: {}.'.format(e), file=sys.stderr)
+        raise SystemExit(1)
+
+
+def _split_frame(job):
+    """Split a frame of a sequence. Runs in the worker pool.
+
+    Returns the frame and the number of decoded bytes, or None if the frame couldn't be split.
+    """
+    args, frame = job
+    try:
+        return frame, _split_file(args, frame.filename, frame)
+    except SystemExit:
+        return frame, None
+
+
+def _lost_frame(job):
+    """Result of _split_frame for a frame whose worker process died (eg. killed for running out of memory)."""
+    _, frame = job
+    print('Error: the worker process splitting {} died.'.format(frame.filename), file=sys.stderr)
+    return frame, None
+
+
+def _planned_split(args, inputfile):
+    """Estimate the memory used to split an image with args (see schedule.footprint), within --max-memory.
+
+    Returns the estimated memory, the size of the decoded pixels (the amount of work) and the arguments to split the
+    image with: images whose decoded pixels don't fit in the budget are split with --stream, unless other arguments
+    prevent it.
+    """
+    try:
+        header = exrheader.read_header(inputfile)
+    except (IOError, OSError, ValueError):
+        return 0, 0, args  # Reported when the image is split
+    fullnames, _ = _selected_channels(args, header)
+    # Converted and transformed pixels are copied to new buffers
+    whole = schedule.footprint(header, fullnames) * ((args.pixel_type or _transformed(args)) and 2 or 1)
+    streamed = schedule.footprint(header, fullnames, args.block_lines) * (args.prefetch + 2)
+    if args.stream:
+        return streamed, whole, args
+    if whole <= args.max_memory or args.multipart or args.incremental or args.normalize_data:
+        return whole, whole, args
+    if not args.quiet:
+        print('Streaming {} (decoding it whole takes about {:.1f} MiB)'.format(inputfile, whole / 2.0 ** 20))
+    import copy
+    args = copy.copy(args)
+    args.stream = True
+    return streamed, whole, args
+
+
+def _scheduled_frames(args, frames):
+    """Split frames, scheduling them within --max-memory (see schedule.Scheduler).
+
+    Yields the results of _split_frame as frames are split, largest first.
+    """
+    plans = [_planned_split(args, x.filename) for x in frames]
+    scheduler = schedule.Scheduler([x[0] for x in plans], args.max_memory, args.jobs, [x[1] for x in plans])
+    jobs = [(_split_frame, stats.enabled(), (plan[2], frame)) for plan, frame in zip(plans, frames)]
+    pool = args.jobs > 1 and workers.Pool(args.jobs, args.pool) or None
+    lost = (lambda job: (_lost_frame(job[2]), []))  # Result of _recorded_job, with no events
+    try:
+        for _, (result, events) in schedule.imap_unordered(scheduler, _recorded_job, jobs, pool, lost):
+            stats.extend(events)
+            yield result
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def _split_frames(args, frames):
+    """Split frames, yielding the results of _split_frame."""
+    if args.max_memory is not None:
+        return _scheduled_frames(args, frames)
+    # Frames split concurrently by workers already overlap reading, so frames are only read ahead without workers
+    readahead = pipeline.readahead(frames, args.jobs <= 1 and args.readahead or 0, lambda x: x.filename)
+    jobs = ((args, frame) for frame in readahead)
+    return _imap(args.jobs, args.pool, _split_frame, jobs, _lost_frame)
+
+
+def _split_sequence(args):
+    frames = _input_frames(args)
+    start = time.time()
+    input_size = 0
+    failed = []
+    for frame_i, (frame, decoded_size) in enumerate(_split_frames(args, frames)):
+        if decoded_size is None:
+            failed.append(frame.filename)
+        else:
+            input_size += os.path.getsize(frame.filename)
+        if not args.quiet or decoded_size is None:
+            print('{}/{} - {} {}'.format(frame_i + 1, len(frames), decoded_size is None and 'Failed' or 'Split',
+                                         frame.filename))
+    elapsed = max(time.time() - start, 1e-6)
+    print('Split {} frames in {:.1f} s ({:.2f} frames/s, {:.1f} MB/s)'.format(
+        len(frames) - len(failed), elapsed, (len(frames) - len(failed)) / elapsed, input_size / elapsed / 1e6))
+    if failed:
+        print('Error: failed splitting {}.'.format(', '.join(failed)), file=sys.stderr)
+        raise SystemExit(1)
+
+
+def _check_transform_args(args):
+    if args.downsample is not None and args.downsample < 1:
+        print('Error: --downsample must be positive.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.normalize_data and args.stream:
+        print('Error: --normalize-data can not be used with --stream.', file=sys.stderr)
+        raise SystemExit(1)
+    if _transformed(args) and not pixels.available():
+        print('Error: --downsample, --unpremultiply, --clamp-data and --normalize-data require NumPy.', file=sys.stderr)
+        raise SystemExit(1)
+
+
+def _check_split_args(args):
+    # Checked even without --stream, since --max-memory streams images that don't fit in memory
+    if args.block_lines < 1:
+        print('Error: --block-lines must be positive.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.prefetch < 0:
+        print('Error: --prefetch can not be negative.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.stream and args.jobs > 1 and args.frames is None:
+        print('Error: --jobs can not be used with --stream.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.multipart and args.stream:
+        print('Error: --multipart can not be used with --stream.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.multipart and not multipart.available():
+        print('Error: --multipart requires the OpenEXR 3.3+ Python bindings and NumPy.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.incremental and (args.stream or args.multipart):
+        print('Error: --incremental can not be used with --stream or --multipart.', file=sys.stderr)
+        raise SystemExit(1)
+    if args.pixel_type and not pixels.available():
+        print('Error: --pixel-type requires NumPy.', file=sys.stderr)
+        raise SystemExit(1)
+    _check_transform_args(args)
+
+
+def split_exr(args):
+    _check_split_args(args)
+    try:
+        if args.frames is not None:
+            _split_sequence(args)
+            return
+        for inputfile in pipeline.readahead(args.image, len(args.image) > 1 and args.readahead or 0):
+            file_args = args if args.max_memory is None else _planned_split(args, inputfile)[2]
+            decoded_size = _split_file(file_args, inputfile)
+            peak = _peak_memory()
+            peak = peak and ', peak memory {:.1f} MiB'.format(peak / 2.0 ** 20) or ''
+            print('Decoded {:.1f} MiB from {}{}'.format(decoded_size / 2.0 ** 20, inputfile, peak))
+    finally:
+        if args.incremental:
+            incremental.evict(args.output_dir)
+
+
+def list_exr(args):
+    inputfiles = args.image if args.frames is None else [x.filename for x in _input_frames(args)]
+    for inputfile in inputfiles:
+        header = _read_header(inputfile)
+        _, grouped_channels = _selected_channels(args, header)
+        for layer_i, layer in enumerate(grouped_channels):
+            layer_channels = ",".join(sorted([str(x.channel) for x in layer]))
+            print('{}/{} - Layer: {}, Channels: ({})'.format(layer_i + 1,
+                                                             len(grouped_channels),
+                                                             layer[0].layer,
+                                                             layer_channels))
+
+
+def _save_stats(args):
+    events = stats.events()
+    stats.take(0)  # So main can run again (eg. in benchmarks) without saving events of previous runs
+    if args.stats:
+        stats.write_json_lines(args.stats, events)
+    if args.trace:
+        stats.write_trace(args.trace, events)
+
+
+def _run_command(argv):
+    """Run a command of a --server client. Returns its exit status."""
+    args = _parse_args(argv)
+    if args.server is not None:
+        print('Error: --server can not be used by clients of a server.', file=sys.stderr)
+        return 1
+    main(args)
+    return 0
 
 
 def main(args):
-    if args.list:
-        list_exr(args)
-    elif args.merge:
-        merge_exr(args)
-    else:
-        split_exr(args)
+    if args.server is not None:
+        server.serve(args.server, _run_command)
+        return
+    stats.enable(bool(args.stats or args.trace))
+    try:
+        if args.list:
+            list_exr(args)
+        elif args.merge:
+            merge_exr(args)
+        else:
+            split_exr(args)
+    finally:
+        if stats.enabled():
+            _save_stats(args)
+            stats.enable(False)
 
 
 if __name__ == '__main__':
+    if os.environ.get(server.SOCKET_VARIABLE) and '--server' not in sys.argv:
+        status = server.request(os.environ[server.SOCKET_VARIABLE], sys.argv[1:])
+        if status is not None:
+            raise SystemExit(status)
     main(_parse_args())
@@ -0,0 +1,211 @@
+"""Copy compressed pixel data of scanline images without decoding it."""
+
+# Pixels of scanline images are stored in chunks of consecutive lines, each
+# compressed independently and located through the offset table that follows
+# the header. Each line of a chunk stores a row of every channel, in
+# alphabetical order of the channel names. A split image is usually written by
+# decoding (decompressing) the chunks and compressing the outputs again, but:
+#
+# * If an output keeps all channels of the input (only renaming them, without
+#   changing their order) and its pixel types and compression, the compressed
+#   chunks are copied unchanged and only the header and the offset table are
+#   rewritten.
+# * Chunks of uncompressed images are raw rows of pixels, so any channels are
+#   extracted by copying their rows.
+#
+# Other compression methods (RLE and ZIP included) compress the rows of all
+# channels of a chunk together, so a subset of channels can't be extracted
+# without decoding them. Those outputs are written by the OpenEXR library.
+#
+# Inputs are memory mapped, so chunks are written to outputs straight from the
+# mapped file, without reading them into new buffers.
+
+from . import exrheader
+import mmap
+import os
+import struct
+
+NO_COMPRESSION = 0
+_LINES_PER_CHUNK = {0: 1, 1: 1, 2: 1, 3: 16, 4: 32, 5: 16, 6: 32, 7: 32, 8: 32, 9: 256}
+_INCREASING_Y = 0
+_MAX_SHORT_NAME = 31
+
+
+class ScanlineImage(object):
+    """Header and compressed chunks of a single-part scanline image.
+
+    Raises ValueError if the image can't be copied (eg. tiled, multi-part or incomplete images).
+    """
+
+    def __init__(self, filename):
+        self._map = None
+        with open(filename, 'rb') as stream:
+            self._read_header(stream)
+            table_end = stream.tell()
+            try:
+                self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            except (mmap.error, ValueError) as e:  # eg. empty files
+                raise ValueError('Failed mapping image: {}'.format(e))
+        self._data = memoryview(self._map)
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            self._check_chunks(table_end)
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self, stream):
+        version = exrheader.read_version(stream)
+        if version & (exrheader.TILED_FLAG | exrheader.NON_IMAGE_FLAG | exrheader.MULTIPART_FLAG):
+            raise ValueError('Not a single-part scanline image')
+        self.records = exrheader.read_records(stream, version)
+        self.header = exrheader.parse_records(self.records)
+        if self.header.get('compression') not in _LINES_PER_CHUNK:
+            raise ValueError('Unsupported compression')
+        if self.header.get('lineOrder', _INCREASING_Y) != _INCREASING_Y:
+            raise ValueError('Unsupported line order')
+        data_window = self.header['dataWindow']
+        lines_per_chunk = _LINES_PER_CHUNK[self.header['compression']]
+        chunk_count = (data_window.max.y - data_window.min.y + lines_per_chunk) // lines_per_chunk
+        table = stream.read(8 * chunk_count)
+        if len(table) != 8 * chunk_count:
+            raise ValueError('Unexpected end of file in offset table')
+        self.chunk_count = chunk_count
+        self._offsets = struct.unpack('<{}Q'.format(chunk_count), table)
+
+    def _check_chunks(self, table_end):
+        """Check that all chunks are complete, so copying doesn't fail after outputs were created."""
+        file_size = len(self._map)
+        for offset in self._offsets:
+            if offset < table_end or offset + 8 > file_size:
+                raise ValueError('Incomplete image')
+            _, size = struct.unpack_from('<ii', self._map, offset)
+            if size < 0 or offset + 8 + size > file_size:
+                raise ValueError('Incomplete image')
+
+    def chunks(self):
+        """Yield the first scanline and the compressed data of each chunk, in increasing scanline order.
+
+        Data is a memoryview of the mapped input, valid until the image is closed. Pages of each chunk are unmapped
+        once the next chunk is requested, so resident memory doesn't grow with the size of the input (the pages stay
+        in the operating system cache).
+        """
+        for offset in self._offsets:
+            y, size = struct.unpack_from('<ii', self._map, offset)
+            yield y, self._data[offset + 8:offset + 8 + size]
+            self._unmap(offset, offset + 8 + size)
+
+    def _unmap(self, start, end):
+        if not hasattr(mmap, 'MADV_DONTNEED'):  # Python < 3.8 or unsupported platform
+            return
+        start -= start % mmap.PAGESIZE
+        self._map.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    def close(self):
+        if self._map is None:
+            return
+        try:
+            if hasattr(self._data, 'release'):  # Python 3.2+
+                self._data.release()
+            self._map.close()
+        except BufferError:  # Chunks are still referenced (eg. by a traceback), unmapped when collected
+            pass
+        self._map = None
+
+
+def _copies_chunks(image, sources):
+    """Check whether chunks of the output are the same as chunks of the input."""
+    return [sources[x] for x in sorted(sources)] == sorted(image.header['channels'])
+
+
+def can_copy(image, sources):
+    """Check whether an output can be copied from the compressed chunks of image.
+
+    sources maps output channel names to input channel names. Pixel types and compression must be the same as in the
+    input, which is checked by the caller.
+    """
+    if _copies_chunks(image, sources):
+        return True
+    channels = image.header['channels'].values()
+    return (image.header['compression'] == NO_COMPRESSION and
+            all(x.x_sampling == 1 and x.y_sampling == 1 for x in channels))
+
+
+def _row_slices(image, sources):
+    """Get the (start, end) byte range of the rows of output channels in a line of an uncompressed chunk."""
+    data_window = image.header['dataWindow']
+    width = data_window.max.x - data_window.min.x + 1
+    rows = {}
+    offset = 0
+    for name in sorted(image.header['channels']):
+        row_size = width * exrheader.PIXEL_TYPE_SIZE[image.header['channels'][name].pixel_type]
+        rows[name] = offset, offset + row_size
+        offset += row_size
+    return [rows[sources[x]] for x in sorted(sources)], offset
+
+
+def _pack_string(text):
+    return text.encode('UTF-8') + b'\0'
+
+
+def _pack_chlist(channels):
+    return b''.join(_pack_string(name) + struct.pack('<iB3xii', *channel)
+                    for name, channel in sorted(channels.items())) + b'\0'
+
+
+def _write_header(output, records, channels, chunk_count):
+    """Write the header and reserve space for the offset table. Returns the offset of the offset table."""
+    names = list(channels) + [x for record in records for x in record[:2]]
+    long_names = any(len(x) > _MAX_SHORT_NAME for x in names)
+    output.write(struct.pack('<ii', exrheader.MAGIC, 2 | (long_names and exrheader.LONG_NAMES_FLAG or 0)))
+    for name, attribute_type, value in records:
+        output.write(_pack_string(name) + _pack_string(attribute_type) + struct.pack('<i', len(value)) + value)
+    output.write(b'\0')
+    table_offset = output.tell()
+    output.seek(8 * chunk_count, os.SEEK_CUR)
+    return table_offset
+
+
+def _write_chunk(output, y, data, repack):
+    """Write a chunk, copying the rows of output channels from data if repack is given (see _row_slices)."""
+    if repack is None:
+        output.write(struct.pack('<ii', y, len(data)))
+        output.write(data)
+        return
+    rows, line_size = repack
+    lines = range(0, len(data), line_size)
+    output.write(struct.pack('<ii', y, len(lines) * sum(end - start for start, end in rows)))
+    for line in lines:
+        for start, end in rows:
+            output.write(data[line + start:line + end])
+
+
+def write(image, outputs, dropped_attributes=()):
+    """Write outputs of image, copying the compressed chunks of their channels.
+
+    outputs is a list of (filename, sources, comments) tuples, where sources maps output channel names to input
+    channel names. Headers are copied from the input, without view, multiView and dropped attributes, with the output
+    channels and with the given comments. The input is read once for all outputs.
+    """
+    removed = set(('channels', 'comments', 'view', 'multiView')).union(dropped_attributes)
+    base_records = [x for x in image.records if x[0] not in removed]
+    files = []
+    try:
+        layouts = []
+        for filename, sources, comments in outputs:
+            channels = {x: image.header['channels'][sources[x]] for x in sources}
+            records = base_records + [('channels', 'chlist', _pack_chlist(channels)), ('comments', 'string', comments)]
+            files.append(open(filename, 'wb'))
+            repack = None if _copies_chunks(image, sources) else _row_slices(image, sources)
+            layouts.append((_write_header(files[-1], records, channels, image.chunk_count), repack, []))
+        for y, data in image.chunks():
+            for output, (_, repack, offsets) in zip(files, layouts):
+                offsets.append(output.tell())
+                _write_chunk(output, y, data, repack)
+        for output, (table_offset, _, offsets) in zip(files, layouts):
+            output.seek(table_offset)
+            output.write(struct.pack('<{}Q'.format(len(offsets)), *offsets))
+    finally:
+        for output in files:
+            output.close()
@@ -0,0 +1,172 @@
+"""Reader for OpenEXR headers that doesn't decode images."""
+
+# An OpenEXR file starts with a magic number and a version field, followed by
+# the header: a list of attributes, each stored as its name and type (null
+# terminated strings), the size of its value (32 bit little endian integer) and
+# the value itself. The header ends with an empty attribute name. Multi-part
+# files have one header per part and the list of headers ends with an empty
+# header. The offset tables and pixel data follow, but aren't read here.
+#
+# Only the header bytes are read, which is much faster than opening the file
+# with the OpenEXR library when the pixels aren't needed (eg. when listing
+# layers of files in network storage). Attribute values are returned in the
+# same form as the OpenEXR Python bindings where it matters to exrsplit: string
+# attributes (such as view) are bytes, string vectors (such as multiView) are
+# lists of bytes and channels are a dictionary indexed by channel name.
+
+import collections
+import struct
+
+MAGIC = 20000630
+TILED_FLAG = 0x200
+LONG_NAMES_FLAG = 0x400
+NON_IMAGE_FLAG = 0x800
+MULTIPART_FLAG = 0x1000
+
+Channel = collections.namedtuple('Channel', ['pixel_type', 'p_linear', 'x_sampling', 'y_sampling'])
+V2i = collections.namedtuple('V2i', ['x', 'y'])
+V2f = collections.namedtuple('V2f', ['x', 'y'])
+Box2i = collections.namedtuple('Box2i', ['min', 'max'])
+Box2f = collections.namedtuple('Box2f', ['min', 'max'])
+TileDescription = collections.namedtuple('TileDescription', ['x_size', 'y_size', 'mode'])
+
+# Pixel types, as stored in channel lists
+UINT, HALF, FLOAT = 0, 1, 2
+PIXEL_TYPE_SIZE = {UINT: 4, HALF: 2, FLOAT: 4}
+
+
+def _read_chlist(value):
+    channels = collections.OrderedDict()
+    offset = 0
+    while value[offset:offset + 1] not in (b'\0', b''):
+        end = value.index(b'\0', offset)
+        name = value[offset:end].decode('UTF-8')
+        pixel_type, p_linear, x_sampling, y_sampling = struct.unpack_from('<iB3xii', value, end + 1)
+        channels[name] = Channel(pixel_type, p_linear, x_sampling, y_sampling)
+        offset = end + 17
+    return channels
+
+
+def _read_stringvector(value):
+    strings = []
+    offset = 0
+    while offset < len(value):
+        size, = struct.unpack_from('<i', value, offset)
+        strings.append(value[offset + 4:offset + 4 + size])
+        offset += 4 + size
+    return strings
+
+
+def _read_box(value, box, vector, value_format):
+    values = struct.unpack(value_format, value)
+    return box(vector(*values[:2]), vector(*values[2:]))
+
+
+def _read_tiledesc(value):
+    x_size, y_size, mode = struct.unpack('<IIB', value)
+    return TileDescription(x_size, y_size, mode)
+
+
+_ATTRIBUTE_READERS = {
+    'box2i': lambda x: _read_box(x, Box2i, V2i, '<4i'),
+    'box2f': lambda x: _read_box(x, Box2f, V2f, '<4f'),
+    'chlist': _read_chlist,
+    'compression': lambda x: struct.unpack('<B', x)[0],
+    'double': lambda x: struct.unpack('<d', x)[0],
+    'float': lambda x: struct.unpack('<f', x)[0],
+    'int': lambda x: struct.unpack('<i', x)[0],
+    'lineOrder': lambda x: struct.unpack('<B', x)[0],
+    'string': lambda x: x,
+    'stringvector': _read_stringvector,
+    'tiledesc': _read_tiledesc,
+    'v2f': lambda x: V2f(*struct.unpack('<2f', x)),
+    'v2i': lambda x: V2i(*struct.unpack('<2i', x)),
+}
+
+
+def _read_string(stream, max_length):
+    """Read a null terminated string, returning an empty string at the end of a header."""
+    chars = []
+    while True:
+        char = stream.read(1)
+        if not char:
+            raise ValueError('Unexpected end of file in header')
+        if char == b'\0':
+            return b''.join(chars).decode('UTF-8')
+        chars.append(char)
+        if len(chars) > max_length:
+            raise ValueError('Attribute name too long')
+
+
+def _read_records(stream, max_length):
+    """Read attributes until the end of a header as (name, type, value) tuples, where values are undecoded bytes.
+
+    Returns an empty list for an empty header.
+    """
+    records = []
+    while True:
+        name = _read_string(stream, max_length)
+        if not name:
+            return records
+        attribute_type = _read_string(stream, max_length)
+        size = stream.read(4)
+        if len(size) != 4:
+            raise ValueError('Unexpected end of file in attribute {}'.format(name))
+        size, = struct.unpack('<i', size)
+        value = stream.read(size)
+        if len(value) != size:
+            raise ValueError('Unexpected end of file in attribute {}'.format(name))
+        records.append((name, attribute_type, value))
+
+
+def parse_records(records):
+    """Decode a header read as (name, type, value) records (see read_records)."""
+    header = collections.OrderedDict()
+    for name, attribute_type, value in records:
+        reader = _ATTRIBUTE_READERS.get(attribute_type)
+        header[name] = reader(value) if reader is not None else value
+    return header
+
+
+def _read_attributes(stream, max_length):
+    """Read attributes until the end of a header. Returns an empty dictionary for an empty header."""
+    return parse_records(_read_records(stream, max_length))
+
+
+def read_version(stream):
+    """Read the magic number and version field of a file. Returns the version flags."""
+    data = stream.read(8)
+    if len(data) != 8:
+        raise ValueError('Not an OpenEXR image')
+    magic, version = struct.unpack('<ii', data)
+    if magic != MAGIC:
+        raise ValueError('Not an OpenEXR image')
+    if version & 0xff != 2:
+        raise ValueError('Unsupported OpenEXR version {}'.format(version & 0xff))
+    return version
+
+
+def read_records(stream, version):
+    """Read the header of a single-part file after its version field, as (name, type, value) records.
+
+    Values are undecoded bytes, so headers can be copied without loss. The stream is left at the offset table.
+    """
+    return _read_records(stream, version & LONG_NAMES_FLAG and 255 or 31)
+
+
+def read_headers(filename):
+    """Read the headers of all parts of an OpenEXR file."""
+    with open(filename, 'rb') as stream:
+        version = read_version(stream)
+        max_length = version & LONG_NAMES_FLAG and 255 or 31
+        headers = [_read_attributes(stream, max_length)]
+        if version & MULTIPART_FLAG:
+            while headers[-1]:
+                headers.append(_read_attributes(stream, max_length))
+            headers.pop()
+    return headers
+
+
+def read_header(filename):
+    """Read the header of an OpenEXR file (of its first part, for multi-part files)."""
+    return read_headers(filename)[0]
@@ -43,7 +43,8 @@
 # Non-identified channels are saved as grayscale.
 
 import collections
-import itertools
+import fnmatch
+import re
 
 _NAME_TO_CHANNEL_TYPE = collections.OrderedDict((
     ('red', 'R'), ('green', 'G'), ('blue', 'B'), ('alpha', 'A'),
@@ -91,25 +92,79 @@ def _get_channel_type(channel):
     return layer_type
 
 
-class EXRChannel:
+class EXRChannel(object):
     """Stores view and layer associated to a channel.
 
     Non-color channels (eg. Z, shadows) are saved as grayscale images.
     """
 
+    __slots__ = ('fullname', 'view', 'layer', 'channel', 'channel_type', 'output_name')
+
     def __init__(self, header, fullname):
         """Get channel data for a given layer in an OpenEXR header.
 
         Sets attibutes view, layer and channel type. view contains the view of
         the layer or None if file has no views. layer contains the layer and
         sublayers names or None if in the default layer. channel_type contains R,
-        G, B, A or DATA.
+        G, B, A or DATA. output_name contains the name of the output file of the
+        layer, as returned by output_file_name.
+
+        To classify many channels of the same header, use classify_channels.
         """
-        self.fullname = fullname
-        self.view = get_view(header, fullname)
-        self.layer = _get_layer(self.view, fullname)
-        self.channel = fullname.rsplit('.', 1)[-1]
-        self.channel_type = _get_channel_type(self.channel)
+        _ChannelClassifier(header).classify(fullname, self)
+
+
+class _ChannelClassifier(object):
+    """Classify channels of a header as EXRChannel, sharing work done for all channels.
+
+    Views are decoded once and channel types are looked up once per channel name, instead of once per channel.
+    """
+
+    def __init__(self, header):
+        if 'view' in header:
+            self._views = {}
+            self._default_view = header['view']
+        else:
+            views = header.get('multiView') or [None]
+            self._views = {x.decode('UTF-8'): x for x in views if x is not None}
+            self._default_view = views[0]
+        self._view_names = {x: x is not None and x.decode('UTF-8') or None
+                            for x in list(self._views.values()) + [self._default_view]}
+        self._channel_types = {}
+
+    def _channel_type(self, channel):
+        channel_type = self._channel_types.get(channel)
+        if channel_type is None:
+            channel_type = self._channel_types[channel] = _get_channel_type(channel)
+        return channel_type
+
+    def classify(self, fullname, channel=None):
+        """Classify a channel, filling the attributes of channel (a new EXRChannel if None)."""
+        if channel is None:
+            channel = EXRChannel.__new__(EXRChannel)
+        view = self._views.get(fullname.split('.', 1)[0], self._default_view)
+        view_name = self._view_names[view]
+        layer, _, name = fullname.rpartition('.')
+        if not layer or layer == view_name:
+            layer = None
+        elif view_name is not None and layer.startswith(view_name + '.'):
+            layer = layer[len(view_name) + 1:]
+        channel.fullname = fullname
+        channel.view = view
+        channel.layer = layer
+        channel.channel = name
+        channel.channel_type = self._channel_type(name)
+        if view_name is None:
+            channel.output_name = layer or 'default_layer'
+        else:
+            channel.output_name = layer is None and view_name or '{}.{}'.format(view_name, layer)
+        return channel
+
+
+def classify_channels(header, fullnames):
+    """Create EXRChannels for the given channels of a header."""
+    classifier = _ChannelClassifier(header)
+    return [classifier.classify(x) for x in fullnames]
 
 
 def output_file_name(channel):
@@ -124,6 +179,63 @@ def output_file_name(channel):
 
 
 def group_channels(channels):
-    """Group channels belonging to the same layer."""
-    channels = sorted(channels, key=output_file_name)
-    return [list(channel_group) for _, channel_group in itertools.groupby(channels, key=output_file_name)]
+    """Group channels belonging to the same layer.
+
+    Groups are sorted by output file name and keep the order of their channels.
+    """
+    groups = {}
+    for channel in channels:
+        group = groups.get(channel.output_name)
+        if group is None:
+            group = groups[channel.output_name] = []
+        group.append(channel)
+    return [groups[x] for x in sorted(groups)]
+
+
+_LAYOUT_CACHE = collections.OrderedDict()
+_LAYOUT_CACHE_SIZE = 64
+
+
+def channel_layout(header, fullnames):
+    """Group the given channels of an image, as group_channels.
+
+    Frames of a sequence usually share the same channels and views, so layouts are cached by channel names and
+    view attributes. The returned groups are shared between calls and must not be modified.
+    """
+    key = (tuple(fullnames), header.get('view'), tuple(header.get('multiView') or ()))
+    layout = _LAYOUT_CACHE.get(key)
+    if layout is None:
+        layout = group_channels(classify_channels(header, fullnames))
+        if len(_LAYOUT_CACHE) >= _LAYOUT_CACHE_SIZE:
+            _LAYOUT_CACHE.popitem(last=False)
+        _LAYOUT_CACHE[key] = layout
+    return layout
+
+
+def _matcher(patterns):
+    """Build a function checking whether any of the names given to it match any of the glob patterns."""
+    match = re.compile('|'.join(fnmatch.translate(x) for x in patterns)).match
+    return lambda names: any(match(x) for x in names if x is not None)
+
+
+def select_channels(layout, layers=None, views=None, channel_types=None):
+    """Select channels of a layout (as returned by group_channels) by layer, view and channel type.
+
+    layers are exact names or glob patterns (eg. car or car.*), matching the layer, output name (view and layer) or
+    full name of channels. Channels of the default layer are named default_layer. views are names of views and
+    channel_types are R, G, B, A or DATA. Criteria that are None select all channels.
+
+    Returns the layout of the selected channels, without empty groups.
+    """
+    if views is not None:
+        views = set(x.encode('UTF-8') for x in views)
+    matches = layers is not None and _matcher(layers)
+    selected = []
+    for group in layout:
+        group = [x for x in group if
+                 (layers is None or matches((x.layer or 'default_layer', x.output_name, x.fullname))) and
+                 (views is None or x.view in views) and
+                 (channel_types is None or x.channel_type in channel_types)]
+        if group:
+            selected.append(group)
+    return selected
@@ -0,0 +1,109 @@
+"""Access to the layers of OpenEXR images as NumPy arrays, without writing files.
+
+>>> image = exrsplit.open('render.exr')  # doctest: +SKIP
+>>> [(x.name, sorted(x.arrays())) for x in image.layers()]  # doctest: +SKIP
+[('car', ['B', 'G', 'R']), ('default_layer', ['A', 'B', 'G', 'R'])]
+
+Layers are grouped as when splitting files. Opening an image only reads its header; the channels of a layer are
+decoded when its pixels are first accessed, so only the layers used are decoded. Arrays are read-only views of the
+decoded pixel data, without copies. Requires NumPy.
+"""
+
+from . import exrheader, exrsplit, pixels
+import OpenEXR
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+class Layer(object):
+    """Layer of an image.
+
+    Has attributes name (the name of the file it is split to, without extension), view (None if the image has no
+    views), layer (None for the default layer) and channels (a list of EXRChannels).
+    """
+
+    def __init__(self, image, channels):
+        self.name = channels[0].output_name
+        self.view = channels[0].view
+        self.layer = channels[0].layer
+        self.channels = channels
+        self._image = image
+        self._arrays = None
+
+    def arrays(self):
+        """Decode the layer on first access. Returns a dictionary mapping channel names (eg. R) to arrays.
+
+        Raises ValueError if channels of the layer are subsampled, since the OpenEXR bindings can't decode them.
+        """
+        if self._arrays is None:
+            self._arrays = self._image._decode(self.channels)
+        return self._arrays
+
+    def __getitem__(self, channel):
+        return self.arrays()[channel]
+
+    def __repr__(self):
+        return '<Layer {} ({})>'.format(self.name, ','.join(x.channel for x in self.channels))
+
+
+class Image(object):
+    """OpenEXR image, opened with exrsplit.open. Multi-part images are accessed through their first part."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = exrheader.read_header(filename)
+        data_window = self.header['dataWindow']
+        self.shape = data_window.max.y - data_window.min.y + 1, data_window.max.x - data_window.min.x + 1
+        self._exr = None
+        self._layers = None
+
+    def layers(self):
+        """List the layers of the image, grouped and sorted as split files."""
+        if self._layers is None:
+            grouped_channels = exrsplit.channel_layout(self.header, list(self.header['channels']))
+            self._layers = [Layer(self, layer) for layer in grouped_channels]
+        return self._layers
+
+    def layer(self, name):
+        """Get a layer by name (as listed in Layer.name)."""
+        for layer in self.layers():
+            if layer.name == name:
+                return layer
+        raise KeyError(name)
+
+    def _decode(self, channels):
+        header_channels = [self.header['channels'][x.fullname] for x in channels]
+        subsampled = [x.fullname for x, y in zip(channels, header_channels) if y.x_sampling != 1 or y.y_sampling != 1]
+        if subsampled:
+            raise ValueError('subsampled channels of {} can not be decoded: {}'.format(
+                self.filename, ', '.join(subsampled)))
+        if self._exr is None:
+            self._exr = OpenEXR.InputFile(self.filename)
+        fullnames = [x.fullname for x in channels]
+        arrays = {}
+        for channel, data in zip(channels, self._exr.channels(fullnames)):
+            dtype = pixels.DTYPES[self.header['channels'][channel.fullname].pixel_type]
+            arrays[channel.channel] = numpy.frombuffer(data, dtype=dtype).reshape(self.shape)
+        return arrays
+
+    def close(self):
+        """Close the input file. Arrays already decoded stay valid."""
+        if self._exr is not None:
+            self._exr.close()
+            self._exr = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open(filename):
+    """Open an OpenEXR image, reading only its header. Raises ValueError if it isn't a valid OpenEXR image."""
+    if not pixels.available():
+        raise ImportError('exrsplit.open requires NumPy')
+    return Image(filename)
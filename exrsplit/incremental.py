@@ -0,0 +1,98 @@
+"""Manifests of split images, to skip writing outputs that didn't change (--incremental)."""
+
+# Each input image has a manifest in the cache directory under the output
+# directory (<output dir>/.exrsplit-cache/<image name>.<path digest>.json),
+# named after a digest of the absolute path of the image, so images of the same
+# name in different directories have separate manifests. It maps output
+# files to a digest of their header and pixel data and to the size and
+# modification time of the file when it was written. An output is skipped if
+# its digest is unchanged and the file wasn't modified or removed since.
+#
+# Frames of sequences have separate manifests, so frames split concurrently
+# don't share files. The number of manifests is bounded by removing the least
+# recently written manifests.
+
+import json
+import os
+
+CACHE_DIRECTORY = '.exrsplit-cache'
+MAX_MANIFESTS = 4096
+
+
+def _attribute_digest(value):
+    if isinstance(value, dict):
+        return repr(sorted((name, str(x)) for name, x in value.items()))
+    return str(value)
+
+
+def digest(header, channel_data):
+    """Digest the header and pixel data of an output file."""
+    import hashlib
+    sha1 = hashlib.sha1()
+    for attribute in sorted(header):
+        sha1.update('{}={}\n'.format(attribute, _attribute_digest(header[attribute])).encode('UTF-8'))
+    for channel in sorted(channel_data):
+        sha1.update('{}:{}\n'.format(channel, len(channel_data[channel])).encode('UTF-8'))
+        sha1.update(channel_data[channel])
+    return sha1.hexdigest()
+
+
+def _file_state(filename):
+    """Get the size and modification time of a file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+class Manifest(object):
+    """Manifest of the outputs of an input image."""
+
+    def __init__(self, output_dir, inputfile):
+        import hashlib
+        path_digest = hashlib.sha1(os.path.abspath(inputfile).encode('UTF-8')).hexdigest()[:16]
+        name = '{}.{}.json'.format(os.path.basename(inputfile), path_digest)
+        self.filename = os.path.join(output_dir, CACHE_DIRECTORY, name)
+        try:
+            with open(self.filename) as f:
+                self._entries = json.load(f)
+        except (IOError, OSError, ValueError):  # Missing or corrupt manifests are rebuilt
+            self._entries = {}
+
+    def is_current(self, target_file, output_digest):
+        """Check whether target_file was written with the given digest and wasn't changed since."""
+        entry = self._entries.get(target_file)
+        return entry is not None and entry[0] == output_digest and entry[1:] == _file_state(target_file)
+
+    def record(self, target_file, output_digest):
+        """Record that target_file was written with the given digest."""
+        self._entries[target_file] = [output_digest] + _file_state(target_file)
+
+    def save(self):
+        directory = os.path.dirname(self.filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # Created concurrently by another worker
+                pass
+        temporary = '{}.{}.tmp'.format(self.filename, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(self._entries, f, sort_keys=True)
+        getattr(os, 'replace', os.rename)(temporary, self.filename)
+
+
+def evict(output_dir, max_manifests=MAX_MANIFESTS):
+    """Remove the least recently written manifests, keeping at most max_manifests."""
+    directory = os.path.join(output_dir, CACHE_DIRECTORY)
+    try:
+        manifests = [os.path.join(directory, x) for x in os.listdir(directory) if x.endswith('.json')]
+    except OSError:
+        return
+    states = [(x, _file_state(x)) for x in manifests]
+    states = sorted((state[1], x) for x, state in states if state is not None)
+    for _, filename in states[:max(len(states) - max_manifests, 0)]:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
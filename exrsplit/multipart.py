@@ -0,0 +1,136 @@
+"""Multi-part OpenEXR images.
+
+OpenEXR 2.0 files may store many independent images (parts) in a single file. The classic OpenEXR Python bindings
+(InputFile/OutputFile) only access the first part, so parts are written and read with the File/Part interface of
+the OpenEXR 3.3+ bindings, which requires NumPy. Headers and pixel data are converted from and to the form used
+by the classic bindings, so the rest of exrsplit handles parts as if they were separate images. Tiled images are
+also written with the File/Part interface.
+"""
+
+import Imath
+from . import exrheader, pixels
+
+# Imported by available(), so commands not using multi-part or tiled images start faster
+OpenEXR = numpy = None
+
+_PIXEL_TYPES = {dtype: pixel_type for pixel_type, dtype in pixels.DTYPES.items()}
+
+
+def available():
+    """Check whether the installed OpenEXR bindings support multi-part images, importing them on first use.
+
+    Other functions require it to be checked first.
+    """
+    global OpenEXR, numpy
+    if numpy is None:
+        try:
+            import numpy as numpy_module
+        except ImportError:  # pragma: no cover
+            return False
+        import OpenEXR as openexr_module
+        OpenEXR, numpy = openexr_module, numpy_module
+    return hasattr(OpenEXR, 'Part')
+
+
+def is_multipart(filename):
+    with open(filename, 'rb') as stream:
+        return bool(exrheader.read_version(stream) & exrheader.MULTIPART_FLAG)
+
+
+def _to_part_attribute(value):
+    """Convert a header attribute from the classic bindings to the File/Part bindings, or None if unsupported."""
+    if isinstance(value, Imath.Box2i):
+        return (numpy.array([value.min.x, value.min.y], dtype='int32'),
+                numpy.array([value.max.x, value.max.y], dtype='int32'))
+    if isinstance(value, Imath.V2f):
+        return numpy.array([value.x, value.y], dtype='float32')
+    if isinstance(value, Imath.Compression):
+        return OpenEXR.Compression(value.v)
+    if isinstance(value, Imath.LineOrder):
+        return OpenEXR.LineOrder(value.v)
+    if isinstance(value, Imath.TileDescription):
+        tiles = OpenEXR.TileDescription()
+        tiles.xSize, tiles.ySize = value.xSize, value.ySize
+        tiles.mode = OpenEXR.LevelMode(value.mode.v)
+        tiles.roundingMode = OpenEXR.LevelRoundingMode(value.roundingMode.v)
+        return tiles
+    if isinstance(value, bytes):
+        return value.decode('UTF-8')
+    if isinstance(value, (int, float, str)):
+        return value
+    return None
+
+
+def _data_window_size(header):
+    data_window = header['dataWindow']
+    return data_window.max.y - data_window.min.y + 1, data_window.max.x - data_window.min.x + 1
+
+
+def _part_header(header, view):
+    part_header = {}
+    for attribute, value in header.items():
+        value = _to_part_attribute(value)  # channels are passed separately and are None here
+        if value is not None:
+            part_header[attribute] = value
+    part_header['type'] = 'tiles' in header and OpenEXR.tiledimage or OpenEXR.scanlineimage
+    if view is not None:
+        part_header['view'] = view.decode('UTF-8') if isinstance(view, bytes) else view
+    return part_header
+
+
+def _part_channels(header, channel_data):
+    shape = _data_window_size(header)
+    return {x: numpy.frombuffer(channel_data[x], dtype=pixels.DTYPES[header['channels'][x].type.v]).reshape(shape)
+            for x in channel_data}
+
+
+def write(filename, parts, threads=1):
+    """Write a multi-part image.
+
+    parts is a list of (name, view, header, channel data) tuples, where header and channel data are in the same
+    form as written with OpenEXR.OutputFile. view may be None.
+    """
+    exr_parts = [OpenEXR.Part(_part_header(header, view), _part_channels(header, channel_data), name)
+                 for name, view, header, channel_data in parts]
+    OpenEXR.File(exr_parts, threads).write(filename)
+
+
+def write_image(filename, header, channel_data):
+    """Write a single-part image, with header and channel data as written with OpenEXR.OutputFile.
+
+    Used for tiled images, which OpenEXR.OutputFile doesn't write correctly.
+    """
+    OpenEXR.File(_part_header(header, None), _part_channels(header, channel_data)).write(filename)
+
+
+class PartReader:
+    """Read a part of a multi-part image through the interface of OpenEXR.InputFile used by exrsplit."""
+
+    def __init__(self, part):
+        self.name = part.name()
+        self._part = part
+        (min_x, min_y), (max_x, max_y) = part.header['dataWindow']
+        self._min_y = int(min_y)
+        self._header = {
+            'channels': {x: Imath.Channel(Imath.PixelType(_PIXEL_TYPES[str(channel.pixels.dtype)]))
+                         for x, channel in part.channels.items()},
+            'dataWindow': Imath.Box2i(Imath.V2i(int(min_x), int(min_y)), Imath.V2i(int(max_x), int(max_y))),
+        }
+
+    def header(self):
+        return self._header
+
+    def channels(self, names, scanLine1, scanLine2):
+        rows = slice(scanLine1 - self._min_y, scanLine2 - self._min_y + 1)
+        return [self._part.channels[x].pixels[rows].tobytes() for x in names]
+
+    def close(self):
+        self._part = None
+
+
+def read(filename):
+    """Open all parts of a multi-part image. Returns a list of PartReaders.
+
+    Pixels of all parts are decoded when the file is opened.
+    """
+    return [PartReader(x) for x in OpenEXR.File(filename, separate_channels=True).parts]
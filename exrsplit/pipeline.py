@@ -0,0 +1,93 @@
+"""Background reading, so input latency (eg. of network storage) overlaps with compressing and writing outputs."""
+
+import threading
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue  # Python 2
+
+_DONE = object()
+_READAHEAD_SIZE = 2 ** 20
+
+
+def _put(items, item, stop):
+    """Put item in a bounded queue, giving up if the consumer stopped. Returns whether it was put."""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(iterable, items, stop):
+    """Put the items of iterable in a queue, followed by _DONE and the exception raised by iterable (or None)."""
+    try:
+        for x in iterable:
+            if not _put(items, (x, None), stop):
+                return
+    except BaseException as e:  # Raised in the consumer
+        _put(items, (_DONE, e), stop)
+        return
+    _put(items, (_DONE, None), stop)
+
+
+def _consume(items):
+    while True:
+        item, error = items.get()
+        if item is _DONE:
+            if error is not None:
+                raise error
+            return
+        yield item
+
+
+def prefetch(iterable, depth):
+    """Iterate over iterable in a background thread, producing up to depth items ahead of the consumer.
+
+    Exceptions raised by iterable are raised to the consumer. A depth smaller than 1 iterates in the caller's
+    thread.
+    """
+    if depth < 1:
+        for x in iterable:
+            yield x
+        return
+    items = queue.Queue(depth)
+    stop = threading.Event()
+    thread = threading.Thread(target=_produce, args=(iterable, items, stop))
+    thread.daemon = True
+    thread.start()
+    try:
+        for x in _consume(items):
+            yield x
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _read_file(filename):
+    """Read a file, discarding its contents, so it is cached by the operating system when it is opened."""
+    try:
+        with open(filename, 'rb') as f:
+            while f.read(_READAHEAD_SIZE):
+                pass
+    except (IOError, OSError):  # Reported when the file is opened
+        pass
+
+
+def readahead(items, depth, filename=None):
+    """Iterate over items, reading the files of up to depth items ahead in a background thread.
+
+    items are file names, or objects whose file name is returned by the filename function. A depth smaller than 1
+    doesn't read ahead.
+    """
+    if depth < 1:
+        return iter(items)
+
+    def read():
+        for x in items:
+            _read_file(filename(x) if filename is not None else x)
+            yield x
+    return prefetch(read(), depth)
@@ -0,0 +1,152 @@
+"""Operations on pixel data decoded by the OpenEXR bindings.
+
+Pixel data is handled as bytes by the OpenEXR bindings. Operations on it are vectorized with NumPy, which is an
+optional dependency, so callers must check available() first. Buffers for pixel data produced here (eg. converted
+or cropped channels) may be reused through a BufferPool, which doesn't require NumPy.
+"""
+
+import collections
+import threading
+
+# Pixel types, as stored in channel lists and Imath.PixelType
+UINT, HALF, FLOAT = 0, 1, 2
+DTYPES = {UINT: 'uint32', HALF: 'float16', FLOAT: 'float32'}
+MAX_POOLED_BYTES = 128 * 2 ** 20
+
+
+def _numpy():
+    """Import NumPy on first use, so commands not using it start faster."""
+    import numpy
+    return numpy
+
+
+def available():
+    """Check whether NumPy is installed."""
+    try:
+        _numpy()
+    except ImportError:  # pragma: no cover
+        return False
+    return True
+
+
+def convert(data, from_type, to_type, out=None):
+    """Convert pixel data between pixel types. Values out of range of the new type are clamped to infinity.
+
+    If out is given, converted data is written to it (eg. a bytearray of a BufferPool) and out is returned.
+
+    >>> convert(b'\\x00\\x00\\x80?', FLOAT, HALF)
+    b'\\x00<'
+    """
+    if from_type == to_type:
+        return data
+    numpy = _numpy()
+    pixel_data = numpy.frombuffer(data, dtype=DTYPES[from_type])
+    with numpy.errstate(over='ignore'):
+        if out is None:
+            return pixel_data.astype(DTYPES[to_type]).tobytes()
+        numpy.copyto(numpy.frombuffer(out, dtype=DTYPES[to_type]), pixel_data, casting='unsafe')
+    return out
+
+
+class BufferPool(object):
+    """Reusable bytearrays for pixel data, so consecutive blocks, layers and frames don't allocate new buffers.
+
+    Buffers are usually the same size from block to block and from frame to frame, so they are reused by exact size.
+    Free buffers are kept up to max_bytes, evicting buffers of the least recently released sizes first.
+    Thread safe, since blocks may be decoded in a background thread (see pipeline.prefetch).
+    """
+
+    def __init__(self, max_bytes=MAX_POOLED_BYTES):
+        self._max_bytes = max_bytes
+        self._free = collections.OrderedDict()  # Size -> free buffers, least recently released sizes first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        """Get a buffer of size bytes. Its contents are undefined."""
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                self._bytes -= size
+                return free.pop()
+        return bytearray(size)
+
+    def release(self, buffers):
+        """Return buffers to the pool once they aren't used.
+
+        Buffers not acquired from a pool (eg. bytes decoded by the OpenEXR bindings) are ignored, as are buffers
+        larger than the pool.
+        """
+        with self._lock:
+            for x in buffers:
+                if isinstance(x, bytearray) and len(x) <= self._max_bytes:
+                    free = self._free.pop(len(x), [])
+                    free.append(x)
+                    self._free[len(x)] = free
+                    self._bytes += len(x)
+            while self._bytes > self._max_bytes:
+                size, free = next(iter(self._free.items()))
+                free.pop()
+                self._bytes -= size
+                if not free:
+                    del self._free[size]
+
+    def size(self):
+        """Returns the bytes of free buffers in the pool."""
+        return self._bytes
+
+
+def array(data, pixel_type, width):
+    """View pixel data as a read-only array of rows of width pixels, without copying it."""
+    numpy = _numpy()
+    return numpy.frombuffer(data, dtype=DTYPES[pixel_type]).reshape(-1, width)
+
+
+def store(pixel_array, out):
+    """Copy an array into a buffer (eg. of a BufferPool) of the same size. Returns the buffer."""
+    numpy = _numpy()
+    numpy.copyto(numpy.frombuffer(out, dtype=pixel_array.dtype).reshape(pixel_array.shape), pixel_array)
+    return out
+
+
+def downsample(pixel_array, factor):
+    """Downsample an array by an integer factor in both directions.
+
+    Each output pixel is the average of a box of factor x factor input pixels (boxes at the right and bottom edges
+    may be smaller). Values of UINT pixels (eg. object IDs) can't be averaged, so the first pixel of each box is
+    kept instead.
+    """
+    numpy = _numpy()
+    if factor == 1:
+        return pixel_array
+    if pixel_array.dtype == numpy.uint32:
+        return pixel_array[::factor, ::factor]
+    height, width = pixel_array.shape
+    rows, columns = numpy.arange(0, height, factor), numpy.arange(0, width, factor)
+    sums = numpy.add.reduceat(numpy.add.reduceat(pixel_array, rows, axis=0, dtype='float64'), columns, axis=1)
+    counts = numpy.outer(numpy.diff(numpy.append(rows, height)), numpy.diff(numpy.append(columns, width)))
+    return (sums / counts).astype(pixel_array.dtype)
+
+
+def unpremultiply(color, alpha):
+    """Divide color by alpha, where alpha isn't 0."""
+    numpy = _numpy()
+    with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        return numpy.where(alpha != 0, color.astype('float32') / alpha, color).astype(color.dtype)
+
+
+def clamp(pixel_array, low, high):
+    numpy = _numpy()
+    return numpy.clip(pixel_array, low, high).astype(pixel_array.dtype)
+
+
+def normalize(pixel_array):
+    """Map the range of finite values of an array to 0 to 1. Infinite values are mapped to 0 or 1."""
+    numpy = _numpy()
+    finite = pixel_array[numpy.isfinite(pixel_array)]
+    if not finite.size:
+        return pixel_array
+    low, high = float(finite.min()), float(finite.max())
+    with numpy.errstate(invalid='ignore', over='ignore'):
+        normalized = (pixel_array.astype('float64') - low) / (high - low or 1)
+    return numpy.clip(normalized, 0, 1).astype(pixel_array.dtype)
@@ -0,0 +1,100 @@
+"""Scheduling of concurrent jobs within a memory budget (--max-memory)."""
+
+# Splitting an image decodes its selected channels whole (unless streaming), so
+# the memory used by a job is estimated from the header of its input: the size
+# of the data window times the size of the pixels of each channel.
+#
+# Jobs are started largest first, as long as the estimates of running jobs fit
+# in the budget and at most max_jobs run at once. When the largest pending job
+# doesn't fit, smaller jobs that fit are started instead, so workers aren't left
+# idle. Starting the largest jobs first shortens the total run time when job
+# sizes vary, since a large job started last would run alone at the end. A job
+# larger than the whole budget runs once no other job is running.
+
+from . import exrheader, workers
+
+
+def footprint(header, fullnames, lines=None):
+    """Estimate the bytes of decoded pixels of the given channels, of lines scanlines or of the whole data window.
+
+    header is read by exrheader.
+    """
+    data_window = header['dataWindow']
+    width = data_window.max.x - data_window.min.x + 1
+    height = data_window.max.y - data_window.min.y + 1
+    if lines is not None:
+        height = min(height, lines)
+    size = 0
+    for name in fullnames:
+        channel = header['channels'][name]
+        size += (-(-width // channel.x_sampling) * -(-height // channel.y_sampling) *
+                 exrheader.PIXEL_TYPE_SIZE[channel.pixel_type])
+    return size
+
+
+class Scheduler(object):
+    """Choose which jobs to start, largest first, within a memory budget and a maximum number of running jobs.
+
+    costs are the estimated memory of each job and sizes the amount of work of each job (by default, their costs),
+    which differ for streamed jobs. A budget of None is unlimited.
+    """
+
+    def __init__(self, costs, budget=None, max_jobs=1, sizes=None):
+        self._costs = costs
+        self._budget = budget
+        self._max_jobs = max(max_jobs, 1)
+        sizes = sizes or costs
+        self._pending = sorted(range(len(costs)), key=lambda x: -sizes[x])  # Stable, so equal jobs keep their order
+        self._running = set()
+        self._used = 0
+
+    def start(self):
+        """Start the jobs that fit in the budget. Returns their indexes, largest first."""
+        started = []
+        for index in self._pending:
+            if len(self._running) >= self._max_jobs:
+                break
+            fits = self._budget is None or self._used + self._costs[index] <= self._budget
+            if fits or not self._running:
+                self._running.add(index)
+                self._used += self._costs[index]
+                started.append(index)
+        if started:
+            started_set = set(started)
+            self._pending = [x for x in self._pending if x not in started_set]
+        return started
+
+    def finish(self, index):
+        self._running.remove(index)
+        self._used -= self._costs[index]
+
+    def done(self):
+        return not self._pending and not self._running
+
+
+def imap_unordered(scheduler, function, items, pool=None, lost=None):
+    """Apply function to items as started by scheduler, yielding (index, result) tuples as jobs complete.
+
+    Jobs run in pool (a workers.Pool) if given, or else one at a time in the calling thread. Exceptions raised by
+    jobs are raised to the caller. If the worker process of a job dies, (index, lost(item)) is yielded, or
+    workers.WorkerLost is raised if lost is None.
+    """
+    completed = []  # Jobs run in the calling thread
+    running = {}  # Id of jobs running in pool -> their index
+    while not scheduler.done():
+        for index in scheduler.start():
+            if pool is None:
+                completed.append((index, (function(items[index]), None)))
+            else:
+                running[pool.submit(function, items[index])] = index
+        if completed:
+            index, (result, error) = completed.pop(0)
+        else:
+            job_id, (result, error) = pool.wait()
+            index = running.pop(job_id)
+        scheduler.finish(index)
+        if isinstance(error, workers.WorkerLost) and lost is not None:
+            result, error = lost(items[index]), None
+        if error is not None:
+            raise error
+        yield index, result
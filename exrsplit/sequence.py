@@ -0,0 +1,77 @@
+"""Frame sequences of OpenEXR images."""
+
+# Render outputs are usually numbered sequences of images, one file per frame.
+# A sequence is given as a file name pattern, where the frame number is
+# represented by a run of # characters (one per digit, eg. beauty.####.exr) or by
+# a printf-style integer (eg. beauty.%04d.exr). Frame numbers are zero padded to
+# the width of the placeholder.
+#
+# Frame ranges are comma separated lists of frames (eg. 7) or inclusive ranges
+# of frames (eg. 1-100), optionally with a step (eg. 1-100x2 for odd frames).
+
+import collections
+import os
+import re
+
+_PLACEHOLDER = re.compile(r'#+|%(0?\d*)d')
+_FRAME_RANGE = re.compile(r'^(\d+)(?:-(\d+)(?:x(\d+))?)?$')
+
+# Frame of a sequence. filename is the path of the image, name is the name of the sequence (the file name before the
+# frame number) and frame is the zero padded frame number.
+Frame = collections.namedtuple('Frame', ['filename', 'name', 'frame'])
+
+
+def _placeholder(pattern):
+    """Find the last frame number placeholder in a pattern."""
+    matches = list(_PLACEHOLDER.finditer(pattern))
+    return matches and matches[-1] or None
+
+
+def is_pattern(pattern):
+    """Check whether a file name has a frame number placeholder.
+
+    >>> is_pattern('beauty.####.exr'), is_pattern('beauty.%04d.exr'), is_pattern('beauty.exr')
+    (True, True, False)
+    """
+    return _placeholder(pattern) is not None
+
+
+def frame_range(text):
+    """Parse a frame range into a list of frame numbers.
+
+    >>> frame_range('1-5x2,10')
+    [1, 3, 5, 10]
+    """
+    frames = []
+    for component in text.split(','):
+        match = _FRAME_RANGE.match(component.strip())
+        if match is None:
+            raise ValueError('Invalid frame range {}'.format(component))
+        first, last, step = match.groups()
+        last = last is None and first or last
+        step = step is None and 1 or int(step)
+        if int(last) < int(first) or step < 1:
+            raise ValueError('Invalid frame range {}'.format(component))
+        frames.extend(range(int(first), int(last) + 1, step))
+    return frames
+
+
+def expand(pattern, frames):
+    """Build the list of Frames of a sequence.
+
+    >>> [x.filename for x in expand('render/beauty.####.exr', [9, 10])]
+    ['render/beauty.0009.exr', 'render/beauty.0010.exr']
+    """
+    placeholder = _placeholder(pattern)
+    if placeholder is None:
+        raise ValueError('{} has no frame number placeholder'.format(pattern))
+    if placeholder.group(0).startswith('#'):
+        width = len(placeholder.group(0))
+    else:
+        width = int(placeholder.group(1) or 0)
+    name = os.path.basename(pattern[:placeholder.start()]).rstrip('._-') or 'frame'
+    sequence = []
+    for frame in frames:
+        frame = str(frame).zfill(width)
+        sequence.append(Frame(pattern[:placeholder.start()] + frame + pattern[placeholder.end():], name, frame))
+    return sequence
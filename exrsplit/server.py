@@ -0,0 +1,144 @@
+"""Long-lived server running exrsplit commands sent over a local UNIX socket (--server).
+
+Render farms usually run exrsplit once per frame, so starting Python and importing the OpenEXR bindings (which
+import NumPy) may take as long as splitting the frame. A server imports them once and runs the commands of clients
+one at a time, reusing cached channel layouts and pooled pixel buffers (up to pixels.MAX_POOLED_BYTES) between
+commands. Commands run in the working directory of the client, without its environment variables.
+"""
+
+# Clients send their command line and working directory as a JSON line.
+# The server sends back JSON lines with the output of the command, as it is
+# printed ({"stream": "stdout" or "stderr", "text": ...}), followed by its
+# exit status ({"exit": status}).
+
+from __future__ import print_function
+import json
+import os
+import socket
+import sys
+
+# Clients forward commands to the server listening at the socket in this environment variable
+SOCKET_VARIABLE = 'EXRSPLIT_SERVER'
+_BACKLOG = 64
+
+
+def _send(connection, message):
+    connection.sendall((json.dumps(message) + '\n').encode('UTF-8'))
+
+
+class _Output(object):
+    """File-like object sending text written to it to the client."""
+
+    def __init__(self, connection, stream):
+        self._connection = connection
+        self._stream = stream
+
+    def write(self, text):
+        if text:
+            _send(self._connection, {'stream': self._stream, 'text': text})
+
+    def flush(self):
+        pass
+
+
+def _exit_status(code):
+    """Convert the code of a SystemExit to an exit status, printing messages (eg. SystemExit('Error'))."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_request(connection, run):
+    """Run the command of a client with output redirected to it."""
+    request = json.loads(connection.makefile('rb').readline().decode('UTF-8'))
+    stdout, stderr, cwd = sys.stdout, sys.stderr, os.getcwd()
+    sys.stdout, sys.stderr = _Output(connection, 'stdout'), _Output(connection, 'stderr')
+    try:
+        os.chdir(request['cwd'])
+        status = run(request['argv'])
+    except SystemExit as e:
+        status = _exit_status(e.code)
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        os.chdir(cwd)
+    _send(connection, {'exit': status})
+
+
+def _is_listening(path):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        return True
+    except (IOError, OSError):
+        return False
+    finally:
+        connection.close()
+
+
+def serve(path, run):
+    """Run commands of clients connecting to a UNIX socket at path until interrupted.
+
+    run(argv) runs a command line, returning its exit status. Only the user running the server may connect.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        print('Error: --server requires UNIX sockets, which are not supported on this platform.', file=sys.stderr)
+        raise SystemExit(1)
+    if os.path.exists(path):
+        if _is_listening(path):
+            print('Error: a server is already listening at {}.'.format(path), file=sys.stderr)
+            raise SystemExit(1)
+        os.remove(path)  # Left by a server that didn't exit cleanly
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(path)
+        os.chmod(path, 0o600)
+        listener.listen(_BACKLOG)
+        print('Listening at {}'.format(path))
+        sys.stdout.flush()
+        while True:
+            connection, _ = listener.accept()
+            try:
+                _run_request(connection, run)
+            except (IOError, OSError, ValueError, KeyError):  # Client disconnected or sent an invalid request
+                pass
+            finally:
+                connection.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def request(path, argv):
+    """Run a command line on the server listening at path, printing its output.
+
+    Returns the exit status of the command, or None if no server is listening (so the command runs locally).
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            connection.connect(path)
+        except (IOError, OSError):
+            return None
+        _send(connection, {'argv': argv, 'cwd': os.getcwd()})
+        for line in connection.makefile('rb'):
+            message = json.loads(line.decode('UTF-8'))
+            if 'exit' in message:
+                return message['exit']
+            stream = sys.stderr if message['stream'] == 'stderr' else sys.stdout
+            stream.write(message['text'])
+    finally:
+        connection.close()
+    print('Error: the server at {} stopped while running the command.'.format(path), file=sys.stderr)
+    return 1
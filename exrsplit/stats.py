@@ -0,0 +1,99 @@
+"""Instrumentation of splitting and merging: timings of phases, bytes and channel counts (--stats and --trace)."""
+
+# Each phase (eg. opening an input, decoding it or writing an output) is
+# recorded as an event with its start time, duration, process and thread, and
+# fields such as the input file, output file, channel count and bytes. Events
+# are only recorded once enabled, so phases cost a function call otherwise.
+#
+# Events recorded by jobs of worker processes are taken from the worker with
+# take() and added to the main process with extend(), along with the results
+# of the jobs.
+#
+# Events are saved as JSON lines (one event per line) or in the Chrome trace
+# event format, which can be opened in chrome://tracing or Perfetto.
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_events = []
+_lock = threading.Lock()
+
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def enabled():
+    return _enabled
+
+
+@contextlib.contextmanager
+def phase(name, **fields):
+    """Record the duration of a phase with the given fields.
+
+    Yields a dictionary of the fields of the event, so counters known only after the phase ran (eg. the number of
+    written bytes) can be added to it.
+    """
+    if not _enabled:
+        yield fields
+        return
+    start = time.time()
+    try:
+        yield fields
+    finally:
+        event = dict(fields, phase=name, start=start, seconds=time.time() - start, pid=os.getpid(),
+                     thread=threading.current_thread().ident)
+        with _lock:
+            _events.append(event)
+
+
+def mark():
+    """Get a mark of the events recorded so far, to take() the events recorded since."""
+    with _lock:
+        return len(_events)
+
+
+def take(since):
+    """Remove and return the events recorded since the given mark().
+
+    Events of other threads may be taken as well. Since they are removed, they are still returned only once.
+    """
+    with _lock:
+        events = _events[since:]
+        del _events[since:]
+    return events
+
+
+def extend(events):
+    """Add events recorded elsewhere (eg. taken from a worker process)."""
+    with _lock:
+        _events.extend(events)
+
+
+def events():
+    """List the events recorded so far, in order of their start time."""
+    with _lock:
+        return sorted(_events, key=lambda x: x['start'])
+
+
+def write_json_lines(filename, events):
+    with open(filename, 'w') as f:
+        for event in events:
+            f.write(json.dumps(event, sort_keys=True) + '\n')
+
+
+def write_trace(filename, events):
+    """Save events in the Chrome trace event format. Times are converted to microseconds."""
+    trace_events = []
+    for event in events:
+        fields = {x: event[x] for x in event if x not in ('phase', 'start', 'seconds', 'pid', 'thread')}
+        trace_events.append({'name': event['phase'], 'cat': 'exrsplit', 'ph': 'X', 'ts': event['start'] * 1e6,
+                             'dur': event['seconds'] * 1e6, 'pid': event['pid'], 'tid': event['thread'],
+                             'args': fields})
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,198 @@
+"""Pools of workers that report jobs lost when their worker process dies (eg. killed for running out of memory)."""
+
+# multiprocessing.Pool replaces worker processes that die, but the job a dead
+# worker was running never completes, so waiting for its result hangs forever.
+# Worker processes are instead started here, each connected by a pipe through
+# which it receives one job at a time and sends back its result. A worker that
+# exits without sending a result (even while receiving a large job) has lost
+# its job, which is reported as such, and the worker is replaced.
+
+import collections
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue  # Python 2
+
+try:
+    from multiprocessing.connection import wait as _wait_ready
+except ImportError:  # pragma: no cover
+    _wait_ready = None  # Python 2, connections are polled
+
+_POLL_SECONDS = 0.01
+
+
+class WorkerLost(Exception):
+    """The worker process running a job died."""
+
+
+def _run(function, x):
+    """Run a job, returning its result or the exception it raised."""
+    try:
+        return function(x), None
+    except Exception as e:
+        return None, e
+
+
+def _serve(connection):
+    """Run the jobs received through connection, sending back their outcomes. Runs in worker processes."""
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:  # The pool was terminated
+            return
+        except Exception as e:  # eg. jobs that can't be unpickled
+            outcome = None, e
+        else:
+            if job is None:  # The pool was closed
+                return
+            outcome = _run(*job)
+        try:
+            connection.send(outcome)
+        except Exception as e:  # eg. results that can't be pickled
+            connection.send((None, RuntimeError('sending the result of a job failed: {}'.format(e))))
+
+
+def Pool(jobs, kind='process'):
+    """Create a pool of jobs worker processes (or threads, if kind is 'thread').
+
+    Jobs are started by submit, which returns their ids, and collected by wait as they complete, in any order.
+    """
+    return _ThreadPool(jobs) if kind == 'thread' else _ProcessPool(jobs)
+
+
+class _ThreadPool(object):
+    def __init__(self, jobs):
+        from multiprocessing.pool import ThreadPool
+        self._pool = ThreadPool(jobs)
+        self._completed = queue.Queue()
+        self._next_id = 0
+
+    def submit(self, function, x):
+        """Start running function(x) in a worker. Returns the id of the job."""
+        job_id = self._next_id
+        self._next_id += 1
+        self._pool.apply_async(_run, (function, x), callback=lambda outcome: self._completed.put((job_id, outcome)))
+        return job_id
+
+    def wait(self):
+        """Wait for a job to complete. Returns its id and a (result, exception) tuple."""
+        return self._completed.get()
+
+    def close(self):
+        self._pool.close()
+
+    def terminate(self):
+        self._pool.terminate()
+
+    def join(self):
+        self._pool.join()
+
+
+class _Worker(object):
+    """Worker process, connected to the pool by a pipe."""
+
+    def __init__(self):
+        import multiprocessing
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child_connection,))
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()  # So receiving fails once the worker exits
+        self.job_id = None
+
+
+class _ProcessPool(object):
+    def __init__(self, jobs):
+        self._workers = [_Worker() for _ in range(max(jobs, 1))]
+        self._pending = collections.deque()  # (job id, function, x) of jobs waiting for a worker
+        self._completed = collections.deque()  # (job id, outcome) of jobs completed without a worker
+        self._next_id = 0
+
+    def submit(self, function, x):
+        """Start running function(x) in a worker. Returns the id of the job."""
+        job_id = self._next_id
+        self._next_id += 1
+        self._pending.append((job_id, function, x))
+        self._dispatch()
+        return job_id
+
+    def wait(self):
+        """Wait for a job to complete. Returns its id and a (result, exception) tuple.
+
+        The exception is the one raised by the job, WorkerLost if its worker process died, or else None.
+        """
+        while not self._completed:
+            busy = [x for x in self._workers if x.job_id is not None]
+            if not busy:
+                raise ValueError('no jobs are running')
+            for worker in self._ready(busy):
+                self._receive(worker)
+            self._dispatch()
+        return self._completed.popleft()
+
+    def _dispatch(self):
+        """Send pending jobs to idle workers."""
+        for i, worker in enumerate(self._workers):
+            if not self._pending:
+                return
+            if worker.job_id is not None:
+                continue
+            job_id, function, x = self._pending.popleft()
+            try:
+                worker.connection.send((function, x))
+            except (EOFError, IOError, OSError):  # The worker died
+                self._completed.append((job_id, (None, self._replace(i))))
+                continue
+            except Exception as e:  # eg. jobs that can't be pickled
+                self._completed.append((job_id, (None, e)))
+                continue
+            worker.job_id = job_id
+
+    @staticmethod
+    def _ready(workers):
+        """Wait for workers that sent a result or exited."""
+        if _wait_ready is not None:
+            ready = set(_wait_ready([x.connection for x in workers] + [x.process.sentinel for x in workers]))
+            return [x for x in workers if x.connection in ready or x.process.sentinel in ready]
+        while True:  # pragma: no cover
+            ready = [x for x in workers if x.connection.poll(_POLL_SECONDS) or not x.process.is_alive()]
+            if ready:
+                return ready
+
+    def _receive(self, worker):
+        job_id, worker.job_id = worker.job_id, None
+        try:
+            outcome = worker.connection.recv()
+        except (EOFError, IOError, OSError):  # The worker exited without sending a result
+            outcome = None, self._replace(self._workers.index(worker))
+        except Exception as e:  # eg. results that can't be unpickled
+            outcome = None, e
+        self._completed.append((job_id, outcome))
+
+    def _replace(self, i):
+        """Replace a dead worker. Returns the WorkerLost error of its job."""
+        worker = self._workers[i]
+        worker.connection.close()
+        worker.process.join()
+        self._workers[i] = _Worker()
+        return WorkerLost('worker process {} died (exit code {})'.format(worker.process.pid, worker.process.exitcode))
+
+    def close(self):
+        """Stop the workers once they finish their jobs."""
+        for worker in self._workers:
+            try:
+                worker.connection.send(None)
+            except (IOError, OSError):  # The worker died
+                pass
+            worker.connection.close()
+
+    def terminate(self):
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.connection.close()
+
+    def join(self):
+        for worker in self._workers:
+            worker.process.join()
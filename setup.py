@@ -39,7 +39,7 @@ setup(
 
     keywords='openexr multilayer',
 
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
 
     # For an analysis of "install_requires" vs pip's requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
@@ -1,3 +1,12 @@
 import collections
 
-CmdArgs = collections.namedtuple('CmdArgs', ['split_channels', 'merge', 'image', 'prefix', 'list', 'layer'])
+CmdArgs = collections.namedtuple('CmdArgs', ['split_channels', 'merge', 'image', 'prefix', 'list', 'layer',
+                                             'stream', 'block_lines', 'view', 'jobs', 'pool',
+                                             'output_dir', 'frames', 'multipart',
+                                             'compression', 'pixel_type', 'luminance', 'region',
+                                             'incremental', 'prefetch', 'quiet', 'stats', 'trace', 'server',
+                                             'downsample', 'unpremultiply', 'clamp_data', 'normalize_data',
+                                             'drop_attribute', 'channel_type', 'max_memory', 'readahead'])
+# Options added after the first release have defaults, matching the command line parser
+CmdArgs.__new__.__defaults__ = (False, 64, None, 1, 'process', '', None, False, None, None, False, None, False, 2,
+                                False, None, None, None, None, False, None, False, None, None, None, 0)
@@ -1,7 +1,14 @@
 import exrsplit.__main__ as exrsplit_main
+from exrsplit import exrheader
+import exrsplit.pixels as pixels
+import Imath
+import json
 from mock import ANY, call, patch, MagicMock
 import pytest
 from cmdargs import CmdArgs
+import os
+import signal
+import struct
 
 
 @pytest.mark.parametrize('flags', [
@@ -26,16 +33,48 @@ def test__create_output_header(header, expected_header):
     assert exrsplit_main._create_output_header(header) == expected_header
 
 
+def test__create_output_header_dropped_attributes():
+    header = {'preview': object(), 'owner': b'someone', 'metadata': [b'data'], 'channels': {'R': '0123'}}
+    output_header = exrsplit_main._create_output_header(header, ['preview'])
+    assert sorted(output_header) == ['channels', 'comments', 'metadata', 'owner']
+    assert output_header['metadata'] is header['metadata']  # Shared, not copied
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_shared_header(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}, 'car.R': {}}, 'preview': b'thumbnail', 'owner': b'someone'}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   drop_attribute=['preview'])
+    exrsplit_main.split_exr(args)
+
+    headers = [x[0][1] for x in mock_OpenEXR_OutputFile.call_args_list]
+    assert [x['channels'] for x in headers] == [{'R': {}}, {'R': {}}]
+    assert headers[0]['channels'] is not headers[1]['channels']
+    assert all('preview' not in x and x['owner'] == b'someone' for x in headers)
+
+
+def test__parse_args_required_attribute():
+    with pytest.raises(SystemExit):
+        exrsplit_main._parse_args(['--drop-attribute', 'dataWindow', 'test.exr'])
+
+
 @patch('OpenEXR.OutputFile')
 @patch('exrsplit.__main__._open_inputfile')
 def test_split_exr_layers(mock___open_inputfile, mock_OpenEXR_OutputFile):
     mock_exr = MagicMock()
     mock_exr.header = lambda: {'channels': {'R': {}, 'G': {}, 'car.R': {}}}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
     mock___open_inputfile.side_effect = lambda x: mock_exr
     args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'])
     exrsplit_main.split_exr(args)
 
     mock___open_inputfile.assert_called_once_with('test.exr')
+    mock_exr.channels.assert_called_once_with(['R', 'G', 'car.R'])
+    mock_exr.channel.assert_not_called()
     mock_OpenEXR_OutputFile.assert_has_calls([
         call('car.exr', {
             'channels': {'R': {}},
@@ -50,3 +89,640 @@ def test_split_exr_layers(mock___open_inputfile, mock_OpenEXR_OutputFile):
         call().writePixels(ANY),
         call().close(),
     ])
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_decodes_once(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}, 'depth': {}, 'car.R': {}}}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=True, merge=False, prefix=False, list=False, layer=['car', 'depth'],
+                   image=['test.exr'])
+    exrsplit_main.split_exr(args)
+
+    mock_exr.channels.assert_called_once_with(['depth', 'car.R'])
+    mock_OpenEXR_OutputFile.return_value.writePixels.assert_has_calls([
+        call({'R': b'car.R'}),
+        call({'R': b'depth', 'G': b'depth', 'B': b'depth'}),
+    ], any_order=True)
+    gray = [x[0][0] for x in mock_OpenEXR_OutputFile.return_value.writePixels.call_args_list if 'G' in x[0][0]][0]
+    assert gray['R'] is gray['G'] is gray['B']
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_luminance(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': 'HALF', 'depth': 'FLOAT'}}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=True, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   luminance=True)
+    exrsplit_main.split_exr(args)
+
+    mock_OpenEXR_OutputFile.assert_has_calls([
+        call('default_layer.R.exr', {'channels': {'R': 'HALF'}, 'comments': b'Processed by exrsplit'}),
+        call().writePixels({'R': b'R'}),
+        call().close(),
+        call('default_layer.depth.exr', {'channels': {'Y': 'FLOAT'}, 'comments': b'Processed by exrsplit'}),
+        call().writePixels({'Y': b'depth'}),
+        call().close(),
+    ])
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_stream(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}, 'car.R': {}}, 'dataWindow': MagicMock(**{'min.y': 0, 'max.y': 4})}
+    mock_exr.channels.side_effect = lambda names, scanLine1, scanLine2: [
+        '{}:{}-{}'.format(name, scanLine1, scanLine2) for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   stream=True, block_lines=2)
+    exrsplit_main.split_exr(args)
+
+    mock_OpenEXR_OutputFile.assert_has_calls([
+        call('car.exr', ANY),
+        call('default_layer.exr', ANY),
+        call().writePixels({'R': 'car.R:0-1'}, 2),
+        call().writePixels({'R': 'R:0-1'}, 2),
+        call().writePixels({'R': 'car.R:2-3'}, 2),
+        call().writePixels({'R': 'R:2-3'}, 2),
+        call().writePixels({'R': 'car.R:4-4'}, 1),
+        call().writePixels({'R': 'R:4-4'}, 1),
+        call().close(),
+        call().close(),
+    ])
+
+
+def _mock_inputfile(channels, data_window=(0, 0, 3, 2)):
+    exr = MagicMock()
+    window = MagicMock(**{'min.x': data_window[0], 'min.y': data_window[1],
+                          'max.x': data_window[2], 'max.y': data_window[3]})
+    exr.header = lambda: {'channels': dict.fromkeys(channels, 'HALF'), 'dataWindow': window}
+    exr.channels.side_effect = lambda names, scanLine1, scanLine2: [
+        '{}:{}-{}'.format(name, scanLine1, scanLine2) for name in names]
+    return exr
+
+
+@patch('exrsplit.pipeline._read_file')
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_merge_exr_stream(mock___open_inputfile, mock_OpenEXR_OutputFile, mock__read_file):
+    inputs = {'default_layer.exr': _mock_inputfile(['R']), 'car.exr': _mock_inputfile(['R'])}
+    mock___open_inputfile.side_effect = lambda x: inputs[x]
+    args = CmdArgs(split_channels=False, merge=True, prefix=False, list=False, layer=None,
+                   image=['default_layer.exr', 'car.exr', 'merged.exr'], block_lines=2)
+    exrsplit_main.merge_exr(args)
+
+    mock_OpenEXR_OutputFile.assert_has_calls([
+        call('merged.exr', ANY),
+        call().writePixels({'R': 'R:0-1', 'car.R': 'R:0-1'}, 2),
+        call().writePixels({'R': 'R:2-2', 'car.R': 'R:2-2'}, 1),
+        call().close(),
+    ])
+    assert all(x.close.called for x in inputs.values())
+    mock__read_file.assert_not_called()  # Blocks are prefetched instead of whole files
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_merge_exr_data_window_mismatch(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    inputs = {'default_layer.exr': _mock_inputfile(['R']), 'car.exr': _mock_inputfile(['R'], (0, 0, 7, 7))}
+    mock___open_inputfile.side_effect = lambda x: inputs[x]
+    args = CmdArgs(split_channels=False, merge=True, prefix=False, list=False, layer=None,
+                   image=['default_layer.exr', 'car.exr', 'merged.exr'])
+    with pytest.raises(SystemExit):
+        exrsplit_main.merge_exr(args)
+    mock_OpenEXR_OutputFile.assert_not_called()
+
+
+@pytest.mark.parametrize('block_lines', ['0', '-1', 'many'])
+def test_merge_exr_invalid_block_lines(block_lines):
+    with pytest.raises(SystemExit):
+        exrsplit_main._parse_args(['-m', '--block-lines', block_lines, 'default_layer.exr', 'car.exr', 'merged.exr'])
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_merge_exr_zero_block_lines(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    args = CmdArgs(split_channels=False, merge=True, prefix=False, list=False, layer=None, block_lines=0,
+                   image=['default_layer.exr', 'car.exr', 'merged.exr'])
+    with pytest.raises(SystemExit):
+        exrsplit_main.merge_exr(args)
+    mock_OpenEXR_OutputFile.assert_not_called()
+
+
+def _kill_on_two(x):
+    if x == 2:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return x * x
+
+
+def test__imap_lost_worker():
+    results = exrsplit_main._imap(2, 'process', _kill_on_two, [1, 2, 3], lost=lambda x: 'lost {}'.format(x))
+    assert list(results) == [1, 'lost 2', 9]
+
+
+def test__imap_lost_worker_fails(capsys):
+    with pytest.raises(SystemExit):
+        list(exrsplit_main._imap(2, 'process', _kill_on_two, [1, 2, 3]))
+    assert 'Error: a worker process died' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('readahead,expected_read_files', [(0, []), (1, ['a.exr', 'b.exr'])])
+@patch('exrsplit.pipeline._read_file')
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_readahead(mock___open_inputfile, mock_OpenEXR_OutputFile, mock__read_file, readahead,
+                             expected_read_files):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}}}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None,
+                   image=['a.exr', 'b.exr'], readahead=readahead)
+    exrsplit_main.split_exr(args)
+
+    # Whole files are only read ahead if requested
+    assert [x[0][0] for x in mock__read_file.call_args_list] == expected_read_files
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_jobs(mock___open_inputfile, mock_OpenEXR_OutputFile, capsys):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}, 'car.R': {}, 'window.R': {}}}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   jobs=2, pool='thread')
+    exrsplit_main.split_exr(args)
+
+    mock_OpenEXR_OutputFile.assert_has_calls([
+        call('car.exr', ANY),
+        call('default_layer.exr', ANY),
+        call('window.exr', ANY),
+    ], any_order=True)
+    mock_OpenEXR_OutputFile.return_value.writePixels.assert_has_calls([
+        call({'R': b'car.R'}),
+        call({'R': b'R'}),
+        call({'R': b'window.R'}),
+    ], any_order=True)
+    assert mock_OpenEXR_OutputFile.return_value.close.call_count == 3
+    assert capsys.readouterr().out.splitlines()[:3] == [
+        '1/3 - Saving 1 channels to car.exr',
+        '2/3 - Saving 1 channels to default_layer.exr',
+        '3/3 - Saving 1 channels to window.exr',
+    ]
+
+
+@pytest.mark.parametrize('max_memory', [None, 2 ** 20])
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_sequence(mock___open_inputfile, mock_OpenEXR_OutputFile, tmpdir, capsys, max_memory):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}, 'car.R': {}}}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    for frame in ('0001', '0002'):
+        tmpdir.join('beauty.{}.exr'.format(frame)).write('')
+    output_dir = str(tmpdir.join('out'))
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None,
+                   image=[str(tmpdir.join('beauty.####.exr'))], jobs=2, pool='thread', output_dir=output_dir,
+                   frames=[1, 2], max_memory=max_memory)
+    exrsplit_main.split_exr(args)
+
+    mock_OpenEXR_OutputFile.assert_has_calls([
+        call(os.path.join(output_dir, 'car', 'car.0001.exr'), ANY),
+        call(os.path.join(output_dir, 'default_layer', 'default_layer.0001.exr'), ANY),
+        call(os.path.join(output_dir, 'car', 'car.0002.exr'), ANY),
+        call(os.path.join(output_dir, 'default_layer', 'default_layer.0002.exr'), ANY),
+    ], any_order=True)
+    assert os.path.isdir(os.path.join(output_dir, 'car'))
+    assert capsys.readouterr().out.splitlines()[-1].startswith('Split 2 frames in ')
+
+
+@pytest.mark.parametrize('text,expected_size', [
+    ('4096', 4096),
+    ('512M', 512 * 2 ** 20),
+    ('1.5g', 3 * 2 ** 29),
+])
+def test__memory_size(text, expected_size):
+    assert exrsplit_main._memory_size(text) == expected_size
+
+
+@pytest.mark.parametrize('text', ['', 'G', '0', '-1K', 'big'])
+def test__memory_size_invalid(text):
+    with pytest.raises(SystemExit):
+        exrsplit_main._parse_args(['--max-memory', text, 'test.exr'])
+
+
+@pytest.mark.parametrize('argv', [
+    ['--max-memory', '1K', '--block-lines', '0'],
+    ['--max-memory', '1K', '--prefetch', '-1'],
+    ['--jobs', '0'],
+    ['-j', '-3'],
+])
+def test__parse_args_invalid_streaming(argv):
+    with pytest.raises(SystemExit):
+        exrsplit_main._parse_args(argv + ['test.exr'])
+
+
+@pytest.mark.parametrize('block_lines,prefetch', [(0, 2), (64, -1)])
+@patch('exrsplit.__main__._planned_split')
+def test_split_exr_invalid_streaming(mock___planned_split, block_lines, prefetch):
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   max_memory=1024, block_lines=block_lines, prefetch=prefetch)
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(args)
+    mock___planned_split.assert_not_called()
+
+
+@pytest.mark.parametrize('argv,expected_plan', [
+    (['--max-memory', '64'], (64, 64, False)),
+    (['--max-memory', '63', '--block-lines', '1', '--prefetch', '0'], (32, 64, True)),  # Read and written lines
+    (['--max-memory', '63', '--incremental'], (64, 64, False)),
+    (['--max-memory', '128', '--pixel-type', 'float'], (128, 128, False)),
+])
+@patch('exrsplit.exrheader.read_header')
+def test__planned_split(mock_read_header, argv, expected_plan):
+    # 4x4 image with two half channels (64 bytes)
+    half = exrheader.Channel(exrheader.HALF, 0, 1, 1)
+    mock_read_header.return_value = {'channels': {'R': half, 'car.R': half},
+                                     'dataWindow': exrheader.Box2i(exrheader.V2i(0, 0), exrheader.V2i(3, 3))}
+    args = exrsplit_main._parse_args(argv + ['-q', 'test.exr'])
+    cost, size, planned_args = exrsplit_main._planned_split(args, 'test.exr')
+    assert (cost, size, planned_args.stream) == expected_plan
+    assert not args.stream
+
+
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_sequence_missing_frame(mock___open_inputfile, tmpdir):
+    mock___open_inputfile.side_effect = SystemExit(1)
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None,
+                   image=[str(tmpdir.join('beauty.####.exr'))], frames=[1])
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(args)
+
+
+@patch('exrsplit.exrheader.read_header')
+def test_list_exr(mock_read_header, capsys):
+    mock_read_header.return_value = {'channels': {'R': {}, 'G': {}, 'car.R': {}, 'carpet.R': {}}}
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=True, layer=['car*'],
+                   image=['a.exr', 'b.exr'])
+    exrsplit_main.main(args)
+
+    mock_read_header.assert_has_calls([call('a.exr'), call('b.exr')])
+    assert capsys.readouterr().out.splitlines() == [
+        '1/2 - Layer: car, Channels: (R)',
+        '2/2 - Layer: carpet, Channels: (R)',
+    ] * 2
+
+
+@pytest.mark.parametrize('header,layer,view,channel_type,expected_fullnames', [
+    ({'channels': {'R': {}, 'car.R': {}, 'carpet.R': {}}}, ['car'], None, None, ['car.R']),
+    ({'channels': {'R': {}, 'car.R': {}, 'car.door.R': {}}}, ['car.*'], None, None, ['car.R', 'car.door.R']),
+    ({'channels': {'R': {}, 'Z': {}, 'car.R': {}}}, ['default_layer'], None, ['DATA'], ['Z']),
+    ({'channels': {'R': {}, 'car.R': {}, 'right.R': {}, 'right.car.R': {}}, 'multiView': [b'left', b'right']},
+     None, ['right'], None, ['right.R', 'right.car.R']),
+    ({'channels': {'R': {}, 'car.R': {}, 'right.R': {}, 'right.car.R': {}}, 'multiView': [b'left', b'right']},
+     ['left.car'], None, None, ['car.R']),
+])
+def test__selected_channels(header, layer, view, channel_type, expected_fullnames):
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=layer, image=['test.exr'],
+                   view=view, channel_type=channel_type)
+    fullnames, layout = exrsplit_main._selected_channels(args, header)
+    assert fullnames == expected_fullnames
+    assert sorted(x.fullname for group in layout for x in group) == sorted(expected_fullnames)
+
+
+def test_split_exr_multipart_stream():
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   stream=True, multipart=True)
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(args)
+
+
+@pytest.mark.parametrize('rules,kind,expected_value', [
+    (None, 'color', None),
+    ([(None, 'zip')], 'data', 'zip'),
+    ([('data', 'piz'), (None, 'zip')], 'data', 'piz'),
+    ([('data', 'piz'), (None, 'zip')], 'color', 'zip'),
+])
+def test__rule(rules, kind, expected_value):
+    assert exrsplit_main._rule(rules, kind) == expected_value
+
+
+@pytest.mark.skipif(not pixels.available(), reason='NumPy unavailable')
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_compression_pixel_type(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    float_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
+    half_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF))
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': float_channel, 'Z': float_channel, 'car.R': float_channel}}
+    mock_exr.channels.side_effect = lambda names: [struct.pack('<f', 1) for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   compression=[(None, 'dwaa'), ('data', 'zip')], pixel_type=[('color', 'half')])
+    exrsplit_main.split_exr(args)
+
+    mock_OpenEXR_OutputFile.assert_has_calls([
+        call('car.exr', {
+            'channels': {'R': half_channel},
+            'comments': b'Processed by exrsplit',
+            'compression': Imath.Compression(Imath.Compression.DWAA_COMPRESSION),
+        }),
+        call().writePixels({'R': b'\x00\x3c'}),
+        call().close(),
+        call('default_layer.exr', {
+            'channels': {'R': half_channel, 'Z': float_channel},
+            'comments': b'Processed by exrsplit',
+            'compression': Imath.Compression(Imath.Compression.DWAA_COMPRESSION),
+        }),
+        call().writePixels({'R': b'\x00\x3c', 'Z': struct.pack('<f', 1)}),
+        call().close(),
+    ])
+
+
+@pytest.mark.skipif(not pixels.available(), reason='NumPy unavailable')
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_transforms(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    # 4x2 image with premultiplied color, downsampled to 2x1
+    float_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
+    values = {'A': [0.5] * 8, 'R': [0.25, 0.25, 0.5, 0.5] * 2, 'Z': [5, 3, -1, -3] * 2}
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {x: float_channel for x in values},
+                               'dataWindow': Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(3, 1))}
+    mock_exr.channels.side_effect = lambda names, **kwargs: [struct.pack('<8f', *values[x]) for x in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   downsample=2, unpremultiply=True, clamp_data=(0, 2))
+    exrsplit_main.split_exr(args)
+
+    out_header = mock_OpenEXR_OutputFile.call_args[0][1]
+    assert str(out_header['dataWindow']) == str(Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(1, 0)))
+    mock_OpenEXR_OutputFile.return_value.writePixels.assert_called_once_with({
+        'A': struct.pack('<2f', 0.5, 0.5), 'R': struct.pack('<2f', 0.5, 1), 'Z': struct.pack('<2f', 2, 0)})
+
+
+@pytest.mark.parametrize('transform', [{'downsample': 2}, {'unpremultiply': True}, {'normalize_data': True}])
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_transforms_subsampled(mock___open_inputfile, mock_OpenEXR_OutputFile, capsys, transform):
+    half_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF))
+    subsampled_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF), 2, 2)
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'Y': half_channel, 'RY': subsampled_channel, 'BY': subsampled_channel},
+                               'dataWindow': Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(3, 3))}
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   **transform)
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(args)
+    mock_exr.channels.assert_not_called()
+    assert 'does not support subsampled channels' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('window,factor,expected_window', [
+    (((0, 0), (3, 1)), 2, ((0, 0), (1, 0))),
+    (((1, -3), (5, 2)), 2, ((0, -2), (2, 0))),
+    (((0, 0), (9, 9)), 3, ((0, 0), (3, 3))),
+])
+def test__downsampled_window(window, factor, expected_window):
+    (min_x, min_y), (max_x, max_y) = window
+    result = exrsplit_main._downsampled_window(Imath.Box2i(Imath.V2i(min_x, min_y), Imath.V2i(max_x, max_y)), factor)
+    assert ((result.min.x, result.min.y), (result.max.x, result.max.y)) == expected_window
+
+
+@pytest.mark.parametrize('argv', [
+    ['--downsample', '0', 'test.exr'],
+    ['--normalize-data', '--stream', 'test.exr'],
+])
+def test_split_exr_transforms_invalid(argv):
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(exrsplit_main._parse_args(argv))
+
+
+@pytest.mark.parametrize('block_lines,origin,expected_blocks', [
+    (2, None, [(1, 2), (3, 4), (5, 5)]),
+    (2, 0, [(1, 1), (2, 3), (4, 5)]),
+    (4, -2, [(1, 1), (2, 5)]),
+])
+def test__scanline_blocks(block_lines, origin, expected_blocks):
+    header = {'dataWindow': Imath.Box2i(Imath.V2i(0, 1), Imath.V2i(3, 5))}
+    assert list(exrsplit_main._scanline_blocks(header, block_lines, origin)) == expected_blocks
+
+
+@pytest.mark.parametrize('header,expected_block_lines', [
+    ({}, 10),
+    ({'tiles': Imath.TileDescription(32, 16)}, 16),
+    ({'tiles': Imath.TileDescription(32, 4)}, 12),
+])
+def test__tile_aligned(header, expected_block_lines):
+    assert exrsplit_main._tile_aligned(10, header) == expected_block_lines
+
+
+@pytest.mark.parametrize('text', ['1,2,3', '1,2,0,4', 'a,b,c,d'])
+def test__region_invalid(text):
+    with pytest.raises(SystemExit):
+        exrsplit_main._parse_args(['--region', text, 'test.exr'])
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_region(mock___open_inputfile, mock_OpenEXR_OutputFile):
+    # 4x3 image starting at (1, 1), with half pixels numbered in raster order
+    half_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF))
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': half_channel},
+                               'dataWindow': Imath.Box2i(Imath.V2i(1, 1), Imath.V2i(4, 3))}
+    mock_exr.channels.side_effect = lambda names, scanLine1, scanLine2: [
+        struct.pack('<{}H'.format(4 * (scanLine2 - scanLine1 + 1)), *range(4 * (scanLine1 - 1), 4 * scanLine2))
+        for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   region=exrsplit_main._region('2,2,3,9'))
+    exrsplit_main.split_exr(args)
+
+    mock_exr.channels.assert_called_once_with(['R'], scanLine1=2, scanLine2=3)
+    out_header = mock_OpenEXR_OutputFile.call_args[0][1]
+    assert str(out_header['dataWindow']) == str(Imath.Box2i(Imath.V2i(2, 2), Imath.V2i(3, 3)))
+    mock_OpenEXR_OutputFile.return_value.writePixels.assert_called_once_with({'R': struct.pack('<4H', 5, 6, 9, 10)})
+
+
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_region_outside(mock___open_inputfile):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}}, 'dataWindow': Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(3, 3))}
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   region=exrsplit_main._region('4,0,8,8'))
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(args)
+    mock_exr.channels.assert_not_called()
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_region_subsampled(mock___open_inputfile, mock_OpenEXR_OutputFile, capsys):
+    half_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF))
+    subsampled_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF), 2, 2)
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'Y': half_channel, 'RY': subsampled_channel, 'BY': subsampled_channel},
+                               'dataWindow': Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(3, 3))}
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   region=exrsplit_main._region('0,0,1,1'))
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(args)
+    mock_exr.channels.assert_not_called()
+    mock_OpenEXR_OutputFile.assert_not_called()
+    assert 'Error: --region does not support subsampled channels.' in capsys.readouterr().err
+
+
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_incremental(mock___open_inputfile, tmpdir, capsys):
+    mock_exr = MagicMock()
+    pixels = {'R': b'R', 'car.R': b'car.R'}
+    mock_exr.header = lambda: {'channels': {'R': {}, 'car.R': {}}}
+    mock_exr.channels.side_effect = lambda names: [pixels[name] for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    output_dir = str(tmpdir)
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   output_dir=output_dir, incremental=True)
+
+    def write_image(filename, header, channel_data):
+        with open(filename, 'wb') as f:
+            f.write(b''.join(channel_data.values()))
+
+    with patch('exrsplit.__main__._write_image', side_effect=write_image) as mock__write_image:
+        exrsplit_main.split_exr(args)
+        assert mock__write_image.call_count == 2
+        pixels['car.R'] = b'changed'
+        mock__write_image.reset_mock()
+        exrsplit_main.split_exr(args)
+        mock__write_image.assert_called_once_with(os.path.join(output_dir, 'car.exr'), ANY, {'R': b'changed'})
+    assert '2/2 - Unchanged {}'.format(os.path.join(output_dir, 'default_layer.exr')) in capsys.readouterr().out
+
+
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_quiet_stats(mock___open_inputfile, mock_OpenEXR_OutputFile, tmpdir, capsys):
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': {}, 'car.R': {}}}
+    mock_exr.channels.side_effect = lambda names: [name.encode('UTF-8') for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    stats_file = str(tmpdir.join('stats.jsonl'))
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   quiet=True, stats=stats_file)
+    exrsplit_main.main(args)
+
+    assert [x for x in capsys.readouterr().out.splitlines() if 'Saving' in x] == []
+    events = [json.loads(x) for x in open(stats_file)]
+    assert [x['phase'] for x in sorted(events, key=lambda x: x['start'])] == [
+        'split', 'open', 'decode', 'write', 'write']
+    assert events[0]['outputs'] == 2 and events[0]['channels'] == 2 and events[0]['decoded_bytes'] == 6
+    assert sorted(x['output'] for x in events if x['phase'] == 'write') == ['car.exr', 'default_layer.exr']
+
+
+@pytest.mark.skipif(not pixels.available(), reason='NumPy unavailable')
+@pytest.mark.parametrize('stream', [False, True])
+@patch('OpenEXR.OutputFile')
+@patch('exrsplit.__main__._open_inputfile')
+def test_split_exr_stats_converted(mock___open_inputfile, mock_OpenEXR_OutputFile, tmpdir, stream):
+    float_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
+    mock_exr = MagicMock()
+    mock_exr.header = lambda: {'channels': {'R': float_channel, 'car.R': float_channel},
+                               'dataWindow': Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(0, 0))}
+    mock_exr.channels.side_effect = lambda names, **kwargs: [struct.pack('<f', 1) for name in names]
+    mock___open_inputfile.side_effect = lambda x: mock_exr
+    stats_file = str(tmpdir.join('stats.jsonl'))
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=['test.exr'],
+                   quiet=True, stats=stats_file, pixel_type=[(None, 'half')], stream=stream)
+    exrsplit_main.main(args)
+
+    # Decoded bytes are counted before converting pixels to half
+    events = [json.loads(x) for x in open(stats_file)]
+    assert [x['decoded_bytes'] for x in events if x['phase'] in ('split', 'decode')] == [8, 8]
+
+
+@pytest.mark.parametrize('argv,expected_server,expected_image', [
+    (['--server', 'exrsplit.sock'], 'exrsplit.sock', []),
+    (['a.exr'], None, ['a.exr']),
+])
+def test__parse_args_server(argv, expected_server, expected_image):
+    args = exrsplit_main._parse_args(argv)
+    assert args.server == expected_server and args.image == expected_image
+
+
+def test__parse_args_missing_image():
+    with pytest.raises(SystemExit):
+        exrsplit_main._parse_args(['--list'])
+
+
+@patch('exrsplit.__main__.main')
+def test__run_command_keeps_buffers(mock_main):
+    buffer = bytearray(16)
+    exrsplit_main._BUFFERS.release([buffer])
+    assert exrsplit_main._run_command(['test.exr']) == 0
+    mock_main.assert_called_once()
+    assert exrsplit_main._BUFFERS.acquire(16) is buffer  # Reused by the next command
+
+
+def _write_image(filename):
+    """Write a small image with B, G and R channels. Returns its pixel data."""
+    import OpenEXR
+    half_channel = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF))
+    pixel_data = {x: struct.pack('<6e', *range(i, i + 6)) for i, x in enumerate('BGR')}
+    header = OpenEXR.Header(3, 2)
+    header['channels'] = dict.fromkeys(pixel_data, half_channel)
+    output = OpenEXR.OutputFile(filename, header)
+    output.writePixels(pixel_data)
+    output.close()
+    return pixel_data
+
+
+def test_split_exr_overwrite_input(tmpdir):
+    import OpenEXR
+    filename = str(tmpdir.join('default_layer.exr'))
+    pixel_data = _write_image(filename)
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=[filename],
+                   output_dir=str(tmpdir))
+    exrsplit_main.split_exr(args)
+
+    # The single layer of the input is written over it, after decoding it
+    exr = OpenEXR.InputFile(filename)
+    assert all(exr.channel(x) == pixel_data[x] for x in pixel_data)
+
+
+def test_split_exr_stream_overwrite_input(tmpdir):
+    import OpenEXR
+    filename = str(tmpdir.join('default_layer.exr'))
+    pixel_data = _write_image(filename)
+    args = CmdArgs(split_channels=False, merge=False, prefix=False, list=False, layer=None, image=[filename],
+                   output_dir=str(tmpdir), stream=True)
+    with pytest.raises(SystemExit):
+        exrsplit_main.split_exr(args)
+
+    # The input is read while streamed outputs are written, so it's left as is
+    exr = OpenEXR.InputFile(filename)
+    assert all(exr.channel(x) == pixel_data[x] for x in pixel_data)
+
+
+def test_merge_exr_overwrite_input(tmpdir):
+    import OpenEXR
+    filenames = [str(tmpdir.join(x)) for x in ('default_layer.exr', 'car.exr')]
+    pixel_data = [_write_image(x) for x in filenames]
+    args = CmdArgs(split_channels=False, merge=True, prefix=False, list=False, layer=None,
+                   image=filenames + [filenames[0]])
+    with pytest.raises(SystemExit):
+        exrsplit_main.merge_exr(args)
+
+    exr = OpenEXR.InputFile(filenames[0])
+    assert all(exr.channel(x) == pixel_data[0][x] for x in pixel_data[0])
@@ -0,0 +1,75 @@
+import exrsplit.chunks as chunks
+import Imath
+import OpenEXR
+import pytest
+import struct
+
+HALF = Imath.Channel(Imath.PixelType(Imath.PixelType.HALF))
+FLOAT = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
+PIXELS = {
+    'car.R': struct.pack('<6e', *range(6)),
+    'car.Z': struct.pack('<6f', *range(6, 12)),
+    'window.R': struct.pack('<6e', *range(12, 18)),
+}
+
+
+@pytest.fixture
+def image(tmpdir):
+    def write(compression):
+        filename = str(tmpdir.join('image.exr'))
+        header = OpenEXR.Header(3, 2)
+        header['channels'] = {'car.R': HALF, 'car.Z': FLOAT, 'window.R': HALF}
+        header['compression'] = Imath.Compression(compression)
+        header['multiView'] = ['car']
+        header['owner'] = b'someone'
+        output = OpenEXR.OutputFile(filename, header)
+        output.writePixels(PIXELS)
+        output.close()
+        return chunks.ScanlineImage(filename)
+    return write
+
+
+@pytest.mark.parametrize('compression,sources,expected_can_copy', [
+    (Imath.Compression.ZIP_COMPRESSION, {'R': 'car.R', 'Z': 'car.Z', 'window.R': 'window.R'}, True),
+    (Imath.Compression.ZIP_COMPRESSION, {'Z': 'car.R', 'R': 'car.Z', 'window.R': 'window.R'}, False),
+    (Imath.Compression.ZIP_COMPRESSION, {'R': 'car.R', 'Z': 'car.Z'}, False),
+    (Imath.Compression.NO_COMPRESSION, {'R': 'window.R', 'G': 'window.R', 'Z': 'car.Z'}, True),
+])
+def test_can_copy(image, compression, sources, expected_can_copy):
+    assert chunks.can_copy(image(compression), sources) == expected_can_copy
+
+
+@pytest.mark.parametrize('compression,sources', [
+    (Imath.Compression.ZIP_COMPRESSION, {'R': 'car.R', 'Z': 'car.Z', 'window.R': 'window.R'}),
+    (Imath.Compression.NO_COMPRESSION, {'Y': 'window.R', 'Z': 'car.Z', 'G': 'window.R'}),
+])
+def test_write(tmpdir, image, compression, sources):
+    filename = str(tmpdir.join('output.exr'))
+    exr = image(compression)
+    chunks.write(exr, [(filename, sources, b'Processed by exrsplit')])
+    exr.close()
+
+    output = OpenEXR.InputFile(filename)
+    header = output.header()
+    assert sorted(header['channels']) == sorted(sources)
+    assert header['compression'].v == compression
+    assert header['comments'] == b'Processed by exrsplit'
+    assert 'multiView' not in header and header['owner'] == b'someone'
+    assert all(output.channel(x) == PIXELS[sources[x]] for x in sources)
+
+
+def test_write_dropped_attributes(tmpdir, image):
+    filename = str(tmpdir.join('output.exr'))
+    exr = image(Imath.Compression.ZIP_COMPRESSION)
+    chunks.write(exr, [(filename, {'R': 'car.R', 'Z': 'car.Z', 'window.R': 'window.R'}, b'')], ['owner'])
+    exr.close()
+    assert 'owner' not in OpenEXR.InputFile(filename).header()
+
+
+def test_scanline_image_incomplete(tmpdir, image):
+    exr = image(Imath.Compression.ZIP_COMPRESSION)
+    exr.close()
+    data = tmpdir.join('image.exr').read_binary()
+    tmpdir.join('image.exr').write_binary(data[:-10])
+    with pytest.raises(ValueError):
+        chunks.ScanlineImage(str(tmpdir.join('image.exr')))
@@ -0,0 +1,62 @@
+import exrsplit.exrheader as exrheader
+import pytest
+import struct
+
+
+def attribute(name, attribute_type, value):
+    return name + b'\0' + attribute_type + b'\0' + struct.pack('<i', len(value)) + value
+
+
+def chlist(*channels):
+    return b''.join(name + b'\0' + struct.pack('<iB3xii', pixel_type, 0, 1, 1)
+                    for name, pixel_type in channels) + b'\0'
+
+
+HEADER = (
+    attribute(b'channels', b'chlist', chlist((b'R', exrheader.HALF), (b'right.Z', exrheader.FLOAT))) +
+    attribute(b'compression', b'compression', b'\3') +
+    attribute(b'dataWindow', b'box2i', struct.pack('<4i', 0, 1, 63, 47)) +
+    attribute(b'multiView', b'stringvector', b'\4\0\0\0left\5\0\0\0right') +
+    attribute(b'owner', b'string', b'someone') +
+    attribute(b'custom', b'someType', b'\1\2') +
+    b'\0'
+)
+
+
+@pytest.fixture
+def exr_file(tmpdir):
+    def write(flags, data):
+        path = tmpdir.join('image.exr')
+        path.write_binary(struct.pack('<ii', exrheader.MAGIC, 2 | flags) + data + b'pixel data')
+        return str(path)
+    return write
+
+
+def test_read_header(exr_file):
+    header = exrheader.read_header(exr_file(0, HEADER))
+    assert list(header['channels']) == ['R', 'right.Z']
+    assert header['channels']['right.Z'] == exrheader.Channel(exrheader.FLOAT, 0, 1, 1)
+    assert header['compression'] == 3
+    assert header['dataWindow'].min.y == 1 and header['dataWindow'].max.x == 63
+    assert header['multiView'] == [b'left', b'right']
+    assert header['owner'] == b'someone'
+    assert header['custom'] == b'\1\2'
+
+
+def test_read_headers_multipart(exr_file):
+    part = attribute(b'name', b'string', b'beauty') + b'\0'
+    headers = exrheader.read_headers(exr_file(exrheader.MULTIPART_FLAG, HEADER + part + b'\0'))
+    assert len(headers) == 2
+    assert headers[1] == {'name': b'beauty'}
+
+
+@pytest.mark.parametrize('data', [
+    b'not an exr',
+    struct.pack('<ii', exrheader.MAGIC, 2) + HEADER[:20],
+    struct.pack('<ii', exrheader.MAGIC, 3) + HEADER,
+])
+def test_read_header_invalid(tmpdir, data):
+    path = tmpdir.join('image.exr')
+    path.write_binary(data)
+    with pytest.raises(ValueError):
+        exrheader.read_header(str(path))
@@ -103,3 +103,37 @@ def test_group_channels(channels, expected_groups):
     groups = exrsplit.group_channels(channels)
     for group, expected_group in zip_longest(groups, expected_groups):
         assert {'{}.{}'.format(exrsplit.output_file_name(x), x.channel) for x in group} == expected_group
+
+
+def test_channel_layout():
+    header = {'multiView': [b'left', b'right']}
+    layout = exrsplit.channel_layout(header, ['car.G', 'right.R', 'car.R'])
+    assert [[x.fullname for x in group] for group in layout] == [['car.G', 'car.R'], ['right.R']]
+    assert exrsplit.channel_layout({'multiView': [b'left', b'right']}, ['car.G', 'right.R', 'car.R']) is layout
+    assert exrsplit.channel_layout({'multiView': [b'right', b'left']}, ['car.G', 'right.R', 'car.R']) is not layout
+
+
+def test_classify_channels(capsys):
+    header = {'multiView': [b'left', b'right']}
+    channels = exrsplit.classify_channels(header, ['car.R', 'right.car.R', 'right.shadow', 'car.shadow'])
+    assert [(x.view, x.layer, x.channel, x.channel_type, x.output_name) for x in channels] == [
+        (b'left', 'car', 'R', 'R', 'left.car'),
+        (b'right', 'car', 'R', 'R', 'right.car'),
+        (b'right', None, 'shadow', 'DATA', 'right'),
+        (b'left', 'car', 'shadow', 'DATA', 'left.car'),
+    ]
+    # Channel names are classified once
+    assert capsys.readouterr().out == 'Unknown channel name shadow set as data\n'
+
+
+@pytest.mark.parametrize('layers,views,channel_types,expected_groups', [
+    (None, None, None, [['car.G', 'car.R'], ['right.R'], ['right.car.R']]),
+    (['car'], None, None, [['car.G', 'car.R'], ['right.car.R']]),
+    (['c?r'], ['right'], None, [['right.car.R']]),
+    (None, None, ['G'], [['car.G']]),
+    (['carpet'], None, None, []),
+])
+def test_select_channels(layers, views, channel_types, expected_groups):
+    layout = exrsplit.channel_layout({'multiView': [b'left', b'right']}, ['car.G', 'right.R', 'car.R', 'right.car.R'])
+    groups = exrsplit.select_channels(layout, layers, views, channel_types)
+    assert [[x.fullname for x in group] for group in groups] == expected_groups
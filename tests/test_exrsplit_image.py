@@ -0,0 +1,64 @@
+import exrsplit
+import exrsplit.pixels as pixels
+import Imath
+from mock import patch
+import OpenEXR
+import pytest
+import struct
+
+pytestmark = pytest.mark.skipif(not pixels.available(), reason='NumPy unavailable')
+
+
+@pytest.fixture
+def image(tmpdir):
+    filename = str(tmpdir.join('image.exr'))
+    header = OpenEXR.Header(3, 2)
+    header['channels'] = {
+        'R': Imath.Channel(Imath.PixelType(Imath.PixelType.HALF)),
+        'car.R': Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT)),
+        'car.G': Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT)),
+    }
+    output = OpenEXR.OutputFile(filename, header)
+    output.writePixels({
+        'R': struct.pack('<6e', 0, 1, 2, 3, 4, 5),
+        'car.R': struct.pack('<6f', *range(6)),
+        'car.G': struct.pack('<6f', *range(6, 12)),
+    })
+    output.close()
+    return filename
+
+
+def test_layers(image):
+    with patch('OpenEXR.InputFile', wraps=OpenEXR.InputFile) as mock_InputFile:
+        with exrsplit.open(image) as exr:
+            layers = exr.layers()
+            assert [x.name for x in layers] == ['car', 'default_layer']
+            mock_InputFile.assert_not_called()
+
+            car = exr.layer('car')
+            assert car['G'].dtype == 'float32'
+            assert car['G'].tolist() == [[6, 7, 8], [9, 10, 11]]
+            assert car['R'][1, 0] == 3
+            assert layers[1]['R'].dtype == 'float16'
+            assert car.arrays() is car.arrays()
+    mock_InputFile.assert_called_once_with(image)
+
+
+def test_layer_missing(image):
+    with pytest.raises(KeyError):
+        exrsplit.open(image).layer('window')
+
+
+def test_layers_subsampled(tmpdir):
+    filename = str(tmpdir.join('image.exr'))
+    header = OpenEXR.Header(4, 2)
+    header['channels'] = {
+        'Y': Imath.Channel(Imath.PixelType(Imath.PixelType.HALF)),
+        'RY': Imath.Channel(Imath.PixelType(Imath.PixelType.HALF), 2, 2),
+    }
+    output = OpenEXR.OutputFile(filename, header)
+    output.writePixels({'Y': struct.pack('<8e', *range(8)), 'RY': struct.pack('<2e', 1, 2)})
+    output.close()
+    with exrsplit.open(filename) as exr:
+        with pytest.raises(ValueError, match='RY'):
+            exr.layer('default_layer').arrays()
@@ -0,0 +1,47 @@
+import exrsplit.incremental as incremental
+import os
+
+
+def test_digest():
+    header = {'channels': {'R': 'HALF', 'G': 'HALF'}, 'comments': b'Processed by exrsplit'}
+    digest = incremental.digest(header, {'R': b'\0\0', 'G': b'\0\1'})
+    assert digest == incremental.digest(dict(reversed(list(header.items()))), {'G': b'\0\1', 'R': b'\0\0'})
+    assert digest != incremental.digest(header, {'R': b'\0\1', 'G': b'\0\0'})
+    assert digest != incremental.digest(dict(header, compression='ZIP'), {'R': b'\0\0', 'G': b'\0\1'})
+
+
+def test_manifest(tmpdir):
+    target = tmpdir.join('car.exr')
+    target.write('pixels')
+    manifest = incremental.Manifest(str(tmpdir), 'image.exr')
+    assert not manifest.is_current(str(target), 'digest')
+    manifest.record(str(target), 'digest')
+    manifest.save()
+
+    manifest = incremental.Manifest(str(tmpdir), 'image.exr')
+    assert manifest.is_current(str(target), 'digest')
+    assert not manifest.is_current(str(target), 'other digest')
+    target.write('modified pixels')
+    assert not manifest.is_current(str(target), 'digest')
+
+
+def test_manifest_same_name(tmpdir):
+    target = tmpdir.join('car.exr')
+    target.write('pixels')
+    manifest = incremental.Manifest(str(tmpdir), os.path.join('a', 'beauty.exr'))
+    manifest.record(str(target), 'digest')
+    manifest.save()
+
+    # Images of the same name in other directories have their own manifests
+    assert not incremental.Manifest(str(tmpdir), os.path.join('b', 'beauty.exr')).is_current(str(target), 'digest')
+    assert incremental.Manifest(str(tmpdir), os.path.join('a', 'beauty.exr')).is_current(str(target), 'digest')
+
+
+def test_evict(tmpdir):
+    cache = tmpdir.mkdir(incremental.CACHE_DIRECTORY)
+    for i in range(4):
+        manifest = cache.join('{}.exr.json'.format(i))
+        manifest.write('{}')
+        os.utime(str(manifest), (i, i))
+    incremental.evict(str(tmpdir), 2)
+    assert sorted(x.basename for x in cache.listdir()) == ['2.exr.json', '3.exr.json']
@@ -0,0 +1,46 @@
+import exrsplit.multipart as multipart
+import Imath
+import OpenEXR
+import pytest
+
+pytestmark = pytest.mark.skipif(not multipart.available(), reason='OpenEXR bindings without multi-part support')
+
+
+def header(pixel_type):
+    return {
+        'channels': {'R': Imath.Channel(Imath.PixelType(pixel_type))},
+        'compression': Imath.Compression(Imath.Compression.ZIP_COMPRESSION),
+        'dataWindow': Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(1, 2)),
+        'displayWindow': Imath.Box2i(Imath.V2i(0, 0), Imath.V2i(1, 2)),
+        'comments': b'Processed by exrsplit',
+    }
+
+
+def test_write_read(tmpdir):
+    filename = str(tmpdir.join('parts.exr'))
+    half = bytes(bytearray(range(12)))
+    single = bytes(bytearray(range(24)))
+    multipart.write(filename, [
+        ('left.car', b'left', header(Imath.PixelType.HALF), {'R': half}),
+        ('right.car', b'right', header(Imath.PixelType.FLOAT), {'R': single}),
+    ])
+
+    assert multipart.is_multipart(filename)
+    parts = multipart.read(filename)
+    assert [x.name for x in parts] == ['left.car', 'right.car']
+    assert str(parts[1].header()['channels']['R']) == str(Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT)))
+    assert parts[0].channels(['R'], scanLine1=0, scanLine2=2) == [half]
+    assert parts[1].channels(['R'], scanLine1=1, scanLine2=2) == [single[8:]]
+
+
+def test_write_image_tiled(tmpdir):
+    filename = str(tmpdir.join('tiled.exr'))
+    tiled_header = header(Imath.PixelType.HALF)
+    tiled_header['tiles'] = Imath.TileDescription(16, 16)
+    half = bytes(bytearray(range(12)))
+    multipart.write_image(filename, tiled_header, {'R': half})
+
+    assert not multipart.is_multipart(filename)
+    exr = OpenEXR.InputFile(filename)
+    assert exr.header()['tiles'].xSize == 16
+    assert exr.channel('R') == half
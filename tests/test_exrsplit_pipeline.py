@@ -0,0 +1,40 @@
+import exrsplit.pipeline as pipeline
+import pytest
+
+
+@pytest.mark.parametrize('depth', [0, 1, 3])
+def test_prefetch(depth):
+    assert list(pipeline.prefetch(iter(range(10)), depth)) == list(range(10))
+
+
+def test_prefetch_bounded():
+    produced = []
+
+    def items():
+        for x in range(100):
+            produced.append(x)
+            yield x
+
+    prefetched = pipeline.prefetch(items(), 2)
+    assert next(prefetched) == 0
+    prefetched.close()
+    # The first item, the queued items and the item waiting to be queued when the consumer stopped
+    assert len(produced) <= 4
+
+
+def test_prefetch_error():
+    def items():
+        yield 1
+        raise IOError('read failed')
+
+    prefetched = pipeline.prefetch(items(), 2)
+    assert next(prefetched) == 1
+    with pytest.raises(IOError):
+        next(prefetched)
+
+
+def test_readahead(tmpdir):
+    tmpdir.join('a.exr').write('a')
+    filenames = [str(tmpdir.join('a.exr')), str(tmpdir.join('missing.exr'))]
+    assert list(pipeline.readahead(filenames, 1)) == filenames
+    assert list(pipeline.readahead([(1, filenames[0])], 1, lambda x: x[1])) == [(1, filenames[0])]
@@ -0,0 +1,81 @@
+import exrsplit.pixels as pixels
+import pytest
+import struct
+
+numpy = pytest.importorskip('numpy')
+
+
+@pytest.mark.parametrize('data,from_type,to_type,expected_data', [
+    (struct.pack('<2f', 1, -2), pixels.FLOAT, pixels.HALF, b'\x00\x3c\x00\xc0'),
+    (b'\x00\x3c\x00\xc0', pixels.HALF, pixels.FLOAT, struct.pack('<2f', 1, -2)),
+    (struct.pack('<f', 1e6), pixels.FLOAT, pixels.HALF, b'\x00\x7c'),  # Infinity
+    (b'\x00\x3c', pixels.HALF, pixels.HALF, b'\x00\x3c'),
+])
+def test_convert(data, from_type, to_type, expected_data):
+    assert pixels.convert(data, from_type, to_type) == expected_data
+
+
+def test_convert_out():
+    out = bytearray(4)
+    assert pixels.convert(struct.pack('<2f', 1, -2), pixels.FLOAT, pixels.HALF, out) is out
+    assert out == b'\x00\x3c\x00\xc0'
+
+
+@pytest.mark.parametrize('released,size,reused', [
+    ([bytearray(4)], 4, True),
+    ([bytearray(4)], 8, False),
+    ([b'\0' * 4], 4, False),
+    ([bytearray(4), bytearray(4), bytearray(4)], 4, True),
+])
+def test_buffer_pool(released, size, reused):
+    pool = pixels.BufferPool(max_bytes=8)
+    pool.release(released)
+    buffer = pool.acquire(size)
+    assert len(buffer) == size and isinstance(buffer, bytearray)
+    assert any(buffer is x for x in released) == reused
+
+
+def test_buffer_pool_evicts_least_recently_released():
+    pool = pixels.BufferPool(max_bytes=10)
+    small, large, larger = bytearray(2), bytearray(4), bytearray(6)
+    pool.release([small, large])
+    pool.release([bytearray(2), larger])  # Buffers of size 2 were released again, so the buffer of size 4 is evicted
+    assert pool.size() == 10
+    assert pool.acquire(6) is larger
+    assert pool.acquire(4) is not large
+    pool.release([bytearray(16)])  # Larger than the pool
+    assert pool.size() == 4
+
+
+@pytest.mark.parametrize('rows,dtype,factor,expected_rows', [
+    ([[1, 3, 5], [3, 5, 7]], 'float32', 2, [[3, 6]]),
+    ([[1, 2], [3, 4]], 'float32', 1, [[1, 2], [3, 4]]),
+    ([[1, 2, 3], [4, 5, 6]], 'uint32', 2, [[1, 3]]),
+])
+def test_downsample(rows, dtype, factor, expected_rows):
+    pixel_array = numpy.array(rows, dtype=dtype)
+    assert pixels.downsample(pixel_array, factor).tolist() == expected_rows
+
+
+def test_unpremultiply():
+    color, alpha = numpy.array([1, 1, 2], dtype='float16'), numpy.array([0.5, 0, 1], dtype='float16')
+    result = pixels.unpremultiply(color, alpha)
+    assert result.dtype == numpy.float16 and result.tolist() == [2, 1, 2]
+
+
+@pytest.mark.parametrize('values,expected_values', [
+    ([1, 3, 2], [0, 1, 0.5]),
+    ([2, 2], [0, 0]),
+    ([float('-inf'), 1, 5, float('nan')], [0, 0, 1, None]),
+])
+def test_normalize(values, expected_values):
+    result = pixels.normalize(numpy.array(values, dtype='float32')).tolist()
+    assert [None if x != x else x for x in result] == expected_values
+
+
+def test_array_store():
+    data = struct.pack('<4f', 1, 2, 3, 4)
+    pixel_array = pixels.array(data, pixels.FLOAT, 2)
+    assert pixel_array.shape == (2, 2)
+    out = bytearray(8)
+    assert pixels.store(pixels.clamp(pixel_array[1], 0, 3.5), out) is out and out == struct.pack('<2f', 3, 3.5)
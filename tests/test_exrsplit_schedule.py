@@ -0,0 +1,87 @@
+from exrsplit import exrheader, workers
+import exrsplit.schedule as schedule
+import os
+import pytest
+import signal
+
+HALF = exrheader.Channel(exrheader.HALF, 0, 1, 1)
+FLOAT = exrheader.Channel(exrheader.FLOAT, 0, 1, 1)
+HALF_SUBSAMPLED = exrheader.Channel(exrheader.HALF, 0, 2, 2)
+
+
+@pytest.mark.parametrize('fullnames,lines,expected_footprint', [
+    (['R', 'Z'], None, 4 * 3 * 6),
+    (['R'], 2, 4 * 2 * 2),
+    (['R'], 10, 4 * 3 * 2),
+    (['RY'], None, 2 * 2 * 2),
+])
+def test_footprint(fullnames, lines, expected_footprint):
+    header = {'channels': {'R': HALF, 'Z': FLOAT, 'RY': HALF_SUBSAMPLED},
+              'dataWindow': exrheader.Box2i(exrheader.V2i(1, 1), exrheader.V2i(4, 3))}
+    assert schedule.footprint(header, fullnames, lines) == expected_footprint
+
+
+def _run(scheduler, finished):
+    """Start jobs, finishing the given jobs after each start. Returns the started jobs of each step."""
+    steps = []
+    for index in finished:
+        steps.append(scheduler.start())
+        scheduler.finish(index)
+    steps.append(scheduler.start())
+    return steps
+
+
+@pytest.mark.parametrize('costs,budget,max_jobs,sizes,finished,expected_steps', [
+    ([10, 30, 20, 5], 40, 2, None, [1, 0, 2], [[1, 0], [2], [3], []]),
+    ([10, 30, 20, 5], None, 3, None, [1], [[1, 2, 0], [3]]),
+    ([100, 10], 50, 2, None, [0], [[0], [1]]),  # Jobs over the budget run alone
+    ([5, 5, 5], 10, 4, None, [0], [[0, 1], [2]]),  # Equal jobs keep their order
+    ([5, 40], 50, 1, [80, 40], [0], [[0], [1]]),  # Streamed jobs are ordered by size
+])
+def test_scheduler(costs, budget, max_jobs, sizes, finished, expected_steps):
+    scheduler = schedule.Scheduler(costs, budget, max_jobs, sizes)
+    assert _run(scheduler, finished) == expected_steps
+
+
+@pytest.fixture(params=[0, 2])
+def pool(request):
+    """No pool (jobs run in the calling thread) or a pool of threads."""
+    if not request.param:
+        yield None
+        return
+    pool = workers.Pool(request.param, 'thread')
+    yield pool
+    pool.terminate()
+
+
+def test_imap_unordered(pool):
+    scheduler = schedule.Scheduler([1, 3, 2], 4, 2)
+    results = list(schedule.imap_unordered(scheduler, lambda x: x * 10, [1, 2, 3], pool))
+    assert sorted(results) == [(0, 10), (1, 20), (2, 30)]
+    assert scheduler.done()
+
+
+def _fail(x):
+    raise IOError('read failed')
+
+
+def test_imap_unordered_error(pool):
+    with pytest.raises(IOError):
+        list(schedule.imap_unordered(schedule.Scheduler([1, 2]), _fail, [1, 2], pool))
+
+
+def _kill_on_two(x):
+    if x == 2:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return x * 10
+
+
+def test_imap_unordered_lost_worker():
+    scheduler = schedule.Scheduler([1, 2, 3], max_jobs=2)
+    pool = workers.Pool(2)
+    try:
+        results = list(schedule.imap_unordered(scheduler, _kill_on_two, [1, 2, 3], pool, lambda x: 'lost'))
+    finally:
+        pool.terminate()
+    assert sorted(results) == [(0, 10), (1, 'lost'), (2, 30)]
+    assert scheduler.done()
@@ -0,0 +1,34 @@
+import exrsplit.sequence as sequence
+import pytest
+
+
+@pytest.mark.parametrize('text,expected_frames', [
+    ('7', [7]),
+    ('1-3', [1, 2, 3]),
+    ('1-6x2', [1, 3, 5]),
+    ('1-2, 10', [1, 2, 10]),
+])
+def test_frame_range(text, expected_frames):
+    assert sequence.frame_range(text) == expected_frames
+
+
+@pytest.mark.parametrize('text', ['', 'a', '3-1', '1-3x0', '1x2'])
+def test_frame_range_invalid(text):
+    with pytest.raises(ValueError):
+        sequence.frame_range(text)
+
+
+@pytest.mark.parametrize('pattern,expected_frames', [
+    ('beauty.####.exr', [sequence.Frame('beauty.0009.exr', 'beauty', '0009'),
+                         sequence.Frame('beauty.0010.exr', 'beauty', '0010')]),
+    ('shot/beauty_%03d.exr', [sequence.Frame('shot/beauty_009.exr', 'beauty', '009'),
+                              sequence.Frame('shot/beauty_010.exr', 'beauty', '010')]),
+    ('v#/%d.exr', [sequence.Frame('v#/9.exr', 'frame', '9'), sequence.Frame('v#/10.exr', 'frame', '10')]),
+])
+def test_expand(pattern, expected_frames):
+    assert sequence.expand(pattern, [9, 10]) == expected_frames
+
+
+def test_expand_without_placeholder():
+    with pytest.raises(ValueError):
+        sequence.expand('beauty.exr', [1])
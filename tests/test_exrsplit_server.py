@@ -0,0 +1,50 @@
+from __future__ import print_function
+import exrsplit.server as server
+import json
+import os
+import pytest
+import socket
+import sys
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='UNIX sockets unavailable')
+
+
+@pytest.mark.parametrize('code,expected_status', [
+    (None, 0),
+    (2, 2),
+    ('Error: failed', 1),
+])
+def test__exit_status(code, expected_status):
+    assert server._exit_status(code) == expected_status
+
+
+def _messages(connection):
+    return [json.loads(x.decode('UTF-8')) for x in connection.makefile('rb')]
+
+
+@pytest.mark.parametrize('run,expected_messages', [
+    (lambda argv: print(' '.join(argv)) or 0, [{'stream': 'stdout', 'text': '--list a.exr'},
+                                               {'stream': 'stdout', 'text': '\n'}, {'exit': 0}]),
+    (lambda argv: sys.exit(3), [{'exit': 3}]),
+])
+def test__run_request(tmpdir, run, expected_messages):
+    client, connection = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    cwd = os.getcwd()
+    server._send(client, {'argv': ['--list', 'a.exr'], 'cwd': str(tmpdir)})
+    server._run_request(connection, run)
+    connection.close()
+    assert _messages(client) == expected_messages
+    assert os.getcwd() == cwd
+    assert sys.stdout is not None and not isinstance(sys.stdout, server._Output)
+
+
+def test__run_request_cwd(tmpdir):
+    client, connection = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    server._send(client, {'argv': [], 'cwd': str(tmpdir)})
+    server._run_request(connection, lambda argv: print(os.getcwd()) or 0)
+    connection.close()
+    assert _messages(client)[0]['text'] == os.path.realpath(str(tmpdir))
+
+
+def test_request_no_server(tmpdir):
+    assert server.request(str(tmpdir.join('missing.sock')), ['--list', 'a.exr']) is None
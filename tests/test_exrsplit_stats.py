@@ -0,0 +1,52 @@
+import exrsplit.stats as stats
+import json
+import pytest
+
+
+@pytest.fixture
+def recorder():
+    stats.enable()
+    yield
+    stats.enable(False)
+    stats.take(0)
+
+
+def test_phase_disabled():
+    with stats.phase('decode', channels=3) as event:
+        event['decoded_bytes'] = 12
+    assert stats.events() == []
+
+
+def test_phase(recorder):
+    with stats.phase('write', output='car.exr') as event:
+        event['written_bytes'] = 12
+    event, = stats.events()
+    assert sorted(event) == ['output', 'phase', 'pid', 'seconds', 'start', 'thread', 'written_bytes']
+    assert event['phase'] == 'write' and event['output'] == 'car.exr' and event['written_bytes'] == 12
+    assert event['seconds'] >= 0
+
+
+def test_take_extend(recorder):
+    with stats.phase('open'):
+        pass
+    since = stats.mark()
+    with stats.phase('write'):
+        pass
+    taken = stats.take(since)
+    assert [x['phase'] for x in taken] == ['write']
+    assert [x['phase'] for x in stats.events()] == ['open']
+    stats.extend(taken)
+    assert [x['phase'] for x in stats.events()] == ['open', 'write']
+
+
+def test_write(recorder, tmpdir):
+    with stats.phase('decode', channels=3):
+        pass
+    events = stats.events()
+    stats.write_json_lines(str(tmpdir.join('stats.jsonl')), events)
+    stats.write_trace(str(tmpdir.join('trace.json')), events)
+
+    assert [json.loads(x) for x in tmpdir.join('stats.jsonl').readlines()] == events
+    trace_event, = json.loads(tmpdir.join('trace.json').read())['traceEvents']
+    assert trace_event['name'] == 'decode' and trace_event['ph'] == 'X' and trace_event['args'] == {'channels': 3}
+    assert trace_event['ts'] == pytest.approx(events[0]['start'] * 1e6)
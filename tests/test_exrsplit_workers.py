@@ -0,0 +1,77 @@
+from exrsplit import workers
+import os
+import pytest
+import signal
+
+
+def _square(x):
+    return x * x
+
+
+def _fail(x):
+    raise IOError('read failed')
+
+
+def _kill_on_two(x):
+    if x == 2:
+        _kill()
+    return x * x
+
+
+def _kill():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+class _KilledOnUnpickling(object):
+    """Kills the worker process unpickling it, as when it runs out of memory receiving a large job."""
+
+    def __reduce__(self):
+        return _kill, ()
+
+
+@pytest.fixture(params=['process', 'thread'])
+def kind(request):
+    return request.param
+
+
+def _outcomes(pool, function, items):
+    """Run function on items in pool. Returns the outcome of each item."""
+    job_ids = [pool.submit(function, x) for x in items]
+    outcomes = dict(pool.wait() for _ in items)
+    pool.close()
+    pool.join()
+    return [outcomes[x] for x in job_ids]
+
+
+def test_pool(kind):
+    assert _outcomes(workers.Pool(2, kind), _square, [1, 2, 3]) == [(1, None), (4, None), (9, None)]
+
+
+def test_pool_error(kind):
+    (result, error), = _outcomes(workers.Pool(2, kind), _fail, [1])
+    assert result is None and isinstance(error, IOError)
+
+
+def test_pool_lost_worker():
+    outcomes = _outcomes(workers.Pool(2), _kill_on_two, [1, 2, 3])
+    assert outcomes[0] == (1, None) and outcomes[2] == (9, None)
+    assert outcomes[1][0] is None and isinstance(outcomes[1][1], workers.WorkerLost)
+
+
+def test_pool_lost_worker_receiving():
+    outcomes = _outcomes(workers.Pool(1), _square, [_KilledOnUnpickling(), 3])
+    assert outcomes[0][0] is None and isinstance(outcomes[0][1], workers.WorkerLost)
+    assert outcomes[1] == (9, None)
+
+
+def _function(x):
+    return lambda: x
+
+
+def test_pool_pickling_errors():
+    # Jobs and results that can't be pickled fail, without stopping other jobs
+    outcomes = _outcomes(workers.Pool(1), _square, [lambda: None, 2])
+    assert outcomes[0][0] is None and outcomes[0][1] is not None
+    assert outcomes[1] == (4, None)
+    (result, error), = _outcomes(workers.Pool(1), _function, [1])
+    assert result is None and isinstance(error, RuntimeError)